@@ -12,36 +12,33 @@ TO DO
 """
 
 import numpy as np
-import datetime
 from pandas import DataFrame, concat
 from pandas.io.parsers import read_csv
-from pandas.tslib import Timestamp
 from functools import wraps
 from financials.utilities.decorators import dataframe
+from financials.utilities.store import ColumnStore, Interner, to_ns, to_ns_array, ns_bounds
+
+_MIN_NS = np.iinfo(np.int64).min
+
+# Period codes used to group the ledger for each frequency
+_PERIODS = {"D": "D", "W": "W", "M": "M", "Y": "A"}
 
 def _set_freq(func):
     """
     Decorator to set frequency
+    The decorated function must return a dataframe for the given
+    period sorted by a datetime index
     """
     @wraps(func)
     def wrapped(self, from_period = None, to_period = None, freq = None):
         df = func(self, from_period, to_period)
-        df = df.set_index("TS").sort_index().loc[from_period:to_period]
-        if freq == None:
-            return df
-        elif freq == "D":
-            t = lambda x: (x.year, x.month, x.day)
-        elif freq == "M":
-            t = lambda x: (x.year, x.month)
-        elif freq == "Y":
-            t = lambda x: x.year
-        elif freq == "W":
-            t = lambda x: (x.year, x.week)
+        if freq in _PERIODS:
+            key = df.index.to_period(_PERIODS[freq])
         elif freq == "WD":
-            t = lambda x: (x.year, x.weekday())
+            key = [df.index.year, df.index.weekday]
         else:
             return df
-        return df.groupby(t).agg({"A": sum})
+        return df.groupby(key).agg({"A": sum})
     return wrapped
 
 class Cash(object):
@@ -49,43 +46,116 @@ class Cash(object):
     A simple cash register
     """
 
-    def __init__(self, initial_amount = 0, TS = datetime.datetime.now(), **kwargs):
+    def __init__(self, initial_amount = 0, TS = None, **kwargs):
         """
         Initialize the cash register with an amount
 
         kwargs
         =====
         TS : TimeStamp for the data
+            By default, the present time is taken
         """
-        self._cash = []
         self._columns = ['A', 'TS', 'I']
-        self._cash.append({"A": initial_amount, "TS": Timestamp(TS), "I": "Opening Balance"})
+        self._tags = Interner()
+        # B holds the running balance after each entry in insertion order
+        self._cash = ColumnStore([('A', np.float64), ('TS', np.int64),
+                                  ('I', np.int64), ('B', np.float64)])
+        self._balance = 0
+        self._snapshot = None
+        self._ordered = True # False once an entry is added out of time order
+        self._last = _MIN_NS
+        self._append(initial_amount, TS, "Opening Balance")
 
     def __repr__(self):
         b = self.balance
-        i = sum(self._cash.A[self._cash.A > 0])
+        A = self._cash["A"]
+        i = A[A > 0].sum()
         o = b - i
         l = 5 if len(self._cash) > 5 else len(self._cash)
         return "Cash Balance: {B:10}\nNet inflows:  {I:10}\nNet outflows: {O:10} \
                 \n{D1:*<50}\nLast 5 transactions\n{D2:-^50}\n{D3}".format \
                 (B = b, I = i, O = o, D1 = "*", D2 = "-",
-                D3 = self._cash.iloc[-l:,:3].set_index("TS").sort_index() if l > 0 else None)
+                D3 = self._frame().iloc[-l:,:3].set_index("TS").sort_index() if l > 0 else None)
+
+    def _append(self, A, TS, I, **kwargs):
+        """
+        Append a single entry and update the running balance
+        """
+        TS = to_ns(TS)
+        self._ordered = self._ordered and TS >= self._last
+        self._last = max(TS, self._last)
+        self._balance += A
+        self._cash.append(A = A, TS = TS, I = self._tags.code(I), B = self._balance,
+                          **kwargs)
+        return self._balance
+
+    def _frame(self, mask = None):
+        """
+        Build a dataframe of entries from the columnar store
+        mask
+            boolean array or indices to select entries
+        """
+        store = self._cash
+        fields = [c for c in store.fields if c != "B"]
+        data = {}
+        for c in fields:
+            arr = store[c] if mask is None else store[c][mask]
+            if c == "TS":
+                arr = arr.view("datetime64[ns]")
+            elif c == "I":
+                arr = self._tags.values(arr)
+            data[c] = arr
+        return DataFrame(data, columns = fields)
+
+    def _sorted(self):
+        """
+        Order of entries by timestamp along with the sorted timestamps
+        and the running balance in that order
+        The snapshot is cached and reused until the register changes
+        """
+        version = self._cash.version
+        if self._snapshot is None or self._snapshot[0] != version:
+            order = np.argsort(self._cash["TS"], kind = "mergesort")
+            self._snapshot = (version, order, self._cash["TS"][order],
+                              self._cash["A"][order].cumsum())
+        return self._snapshot[1:]
+
+    def _window(self, from_period = None, to_period = None):
+        """
+        Entries between the given periods sorted by timestamp
+        along with the running balance
 
+        Entries are located by binary search on the timestamps so only
+        the requested window is materialized
+        """
+        lo, hi = ns_bounds(from_period, to_period)
+        if self._ordered:
+            TS, balance = self._cash["TS"], self._cash["B"]
+            i, j = TS.searchsorted(lo, "left"), TS.searchsorted(hi, "right")
+            index = slice(i, j)
+        else:
+            order, TS, balance = self._sorted()
+            i, j = TS.searchsorted(lo, "left"), TS.searchsorted(hi, "right")
+            index = order[i:j]
+        df = self._frame(index)
+        df["balance"] = balance[i:j]
+        return df.set_index("TS")
 
     @property
     def d(self):
         """
         Get the entire cash register
         """
-        return self._cash
+        return self._frame()
 
-    def add(self, A, TS = datetime.datetime.now(), I = "Cash added", **kwargs):
+    def add(self, A, TS = None, I = "Cash added", **kwargs):
         """
         Add cash to this register
 
         A: Amount of cash
 
         TS: Date or time in specified format
+            By default, the present time is taken
 
         **kwargs
         ========
@@ -93,62 +163,100 @@ class Cash(object):
         You could add any number of keyword arguments. Each argument is
         added as a separate column.
         """
+        return self._append(abs(A), TS, I, **kwargs)
 
-        D = {'A': abs(A), 'TS': Timestamp(TS), 'I': I}
-        self._cash.append(D)
-        return self.balance
-
-    def wd(self, A, TS = datetime.datetime.now(), I = "Cash withdrawn", **kwargs):
+    def wd(self, A, TS = None, I = "Cash withdrawn", **kwargs):
         """
         Withdraw cash from register
 
         A: Amount of cash
         TS: Date or time in specified format
+            By default, the present time is taken
+        """
+        return self._append(-abs(A), TS, I, **kwargs)
+
+    def extend(self, A, TS, I = "Cash added"):
+        """
+        Add a batch of entries to this register
+
+        A: array of amounts; positive for inflows and negative for outflows
+        TS: array of timestamps as nanoseconds or datetimes
+        I: information; a single value or an array
         """
-        D = {'A': -abs(A), 'TS': TS, 'I': I}
-        self._cash.append(D)
-        return self.balance
+        A = np.asarray(A, dtype = np.float64)
+        if len(A) == 0:
+            return self._balance
+        TS = to_ns_array(TS, len(A))
+        I = self._tags.code(I) if np.ndim(I) == 0 else self._tags.codes(I)
+        self._ordered = (self._ordered and TS[0] >= self._last and
+                         bool(np.all(TS[1:] >= TS[:-1])))
+        self._last = max(TS.max(), self._last)
+        B = self._balance + A.cumsum()
+        self._cash.extend(A = A, TS = TS, I = I, B = B)
+        self._balance = B[-1]
+        return self._balance
 
+    def below(self, limit = 0):
+        """
+        Entries after which the running balance is below the limit
+        Only the matching entries are materialized
+        """
+        if self._ordered:
+            rows = np.flatnonzero(self._cash["B"] < limit)
+            balance = self._cash["B"][rows]
+        else:
+            order, TS, balance = self._sorted()
+            rows = np.flatnonzero(balance < limit)
+            balance, rows = balance[rows], order[rows]
+        df = self._frame(rows)
+        df["balance"] = balance
+        return df.set_index("TS")[["A", "I", "balance"]]
+
+    @property
+    def version(self):
+        """
+        A number that changes whenever the register changes
+        """
+        return self._cash.version
 
     @property
     def balance(self):
         """
         Balance in your cash register
         """
-        return sum(x["A"] for x in self._cash)
+        return self._balance
 
     @_set_freq
     def ledger(self, from_date = None, to_date = None, freq = None):
         """
         Show the cash ledger
         """
-        df = DataFrame(self._cash)[self._columns]
-        df.set_index("TS", inplace = True)
-        df.sort_index(inplace = True)
-        df['balance'] = df['A'].cumsum()
-        return df.reset_index() # Hack to make decorator work
+        return self._window(from_date, to_date)[["A", "I", "balance"]]
 
     def clear(self):
         """
         Clear all entries in the cash register
         """
-        self._cash = []
+        self._cash.clear()
+        self._balance = 0
+        self._ordered = True
+        self._last = _MIN_NS
 
     @_set_freq
     def inflows(self, from_date = None, to_date = None, freq = None):
         """
         Cash inflows for the given period
         """
-        df = DataFrame(self._cash)[self._columns]
-        return df[df.A > 0]
+        df = self._window(from_date, to_date)
+        return df[df.A > 0][["A", "I"]]
 
     @_set_freq
     def outflows(self, from_period = None, to_period = None, freq = None):
         """
         Cash outflows for the given period
         """
-        df = DataFrame(self._cash)[self._columns]
-        return df[df.A < 0]
+        df = self._window(from_period, to_period)
+        return df[df.A < 0][["A", "I"]]
 
     @_set_freq
     def zeroflows(self, from_period = None, to_period = None, freq = None):
@@ -156,14 +264,14 @@ class Cash(object):
         Outflows equal to zero
         This is just for theoretical usage
         """
-        df = DataFrame(self._cash)[self._columns]
-        return df[df.A == 0]
+        df = self._window(from_period, to_period)
+        return df[df.A == 0][["A", "I"]]
 
     def summarize(self, tags = ["I"], from_period = None, to_period = None):
         """
         Tags as list
         """
-        df = DataFrame(self._cash)
+        df = self._frame()
         return df.groupby(tags).agg({"A": sum}).loc[from_period: to_period]
 
     def f(self, query):
@@ -172,5 +280,4 @@ class Cash(object):
         query
             A valid pandas dataframe query
         """
-        df = DataFrame(self._cash)
-        return df.query(query)
\ No newline at end of file
+        return self._frame().query(query)
@@ -16,6 +16,30 @@ def test_transactions():
     cash.wd(5000)
     cash.wd(-5000) # Again, this has no effect
     assert cash.balance == 12000
+
+def test_extend():
+    cash = Cash(1000, TS = "2014-01-01")
+    cash.extend([500, -200, -100], ["2014-01-03", "2014-01-02", "2014-01-04"], I = "Trade")
+    assert cash.balance == 1200
+    ledger = cash.ledger()
+    assert list(ledger.A) == [1000, -200, 500, -100]
+    assert list(ledger.balance) == [1000, 800, 1300, 1200]
+    assert list(cash.inflows().A) == [1000, 500]
+    assert list(cash.outflows().I) == ["Trade", "Trade"]
+    cash.clear()
+    assert cash.balance == 0
+
+def test_frequency():
+    cash = Cash(1000, TS = "2014-01-01")
+    cash.extend([500, -200, -100], ["2014-01-20", "2014-02-02", "2015-03-04"])
+    order = cash._sorted()[0]
+    assert cash._sorted()[0] is order # reused until the next entry
+    assert list(cash.ledger(freq = "M").A) == [1500, -200, -100]
+    assert list(cash.ledger(freq = "Y").A) == [1300, -100]
+    assert list(cash.outflows("2014-01-01", "2014-12-31", freq = "M").A) == [-200]
+    cash.wd(50, TS = "2015-03-05")
+    assert cash._sorted()[0] is not order
+    assert list(cash.ledger(freq = "Y").A) == [1300, -150]
     
 class TestCash(unittest.TestCase):
     cash = Cash(10000, TS = "2014-01-01")
@@ -48,3 +72,14 @@ class TestCash(unittest.TestCase):
                     ]
         [self.cash.wd(A = a, TS = t, I = i) for (a,t,i) in payments]
         assert self.cash.balance == 7850  
+
+def test_window():
+    cash = Cash(1000, TS = "2014-01-01")
+    cash.add(100, TS = "2014-03-05 10:00")
+    cash.wd(300, TS = "2014-02-10")  # out of order
+    cash.add(50, TS = "2014-03-31 23:00")
+    ledger = cash.ledger("2014-02", "2014-03")
+    assert list(ledger.A) == [-300, 100, 50]
+    assert list(ledger.balance) == [700, 800, 850]
+    assert list(cash.ledger("2014-03-05", "2014-03-05").A) == [100]
+    assert len(cash.ledger("2015", "2015")) == 0
@@ -1,6 +1,8 @@
 # Connect from and to HDF5 class
 
+import numpy as np
 from collections import Iterable
+from numbers import Number
 from tables import open_file, NodeError
 from pandas import DataFrame
 from pandas.tslib import Timestamp
@@ -48,7 +50,7 @@ class HDF5Connection(object):
         for k,v in condition.iteritems():
             a,b = v
             b = b if isinstance(b, Iterable) else [b]
-            b = ["'" + str(x) + "'" if not isinstance(x, (int, float))
+            b = ["'" + str(x) + "'" if not isinstance(x, Number)
                  else x for x in b]
             expr.append("(" + '|'.join(["(" + k + a + str(x) + ")" for x in b]) + ")")
         builder = expr[0]
@@ -116,32 +118,56 @@ length of condition")
         return result
 
     def extract_data(self, path, condition, cols = None, ts_col = None, \
-    from_date = None, to_date = None):
+    from_date = None, to_date = None, as_array = False, chunksize = None):
         """
         Extract data from a compound datatype
         path
             path to the data
         condition
             condition to search for
+            All rows are returned if None or empty
         cols
             columns to return
         ts_col
             column containing datetime
         from_date
+            first date to return; needed along with ts_col
+        to_date
+            last date to return; needed along with ts_col
+        as_array
+            If True, returns a numpy structured array instead of
+            a dataframe
+        chunksize
+            If given, returns an iterator over the results of each
+            chunksize rows of the table so that memory is bounded
 
+        Rows matching the condition are read in bulk by PyTables and only
+        the requested columns are kept
         """
         data = self._f.get_node(path)
-        cond = self._build_condition(condition = condition)
+        cond = [self._build_condition(condition = condition)] if condition else []
         if ts_col is not None:
             if (from_date is None) or (to_date is None):
                 raise ValueError("Dates not matching")
             f,t = Timestamp(from_date).value, Timestamp(to_date).value
-            cond = cond + "&" + self._build_condition({ts_col: (">=", f)})
-            cond = cond + "&" + self._build_condition({ts_col: ("<=", t)})
+            cond.append(self._build_condition({ts_col: (">=", f)}))
+            cond.append(self._build_condition({ts_col: ("<=", t)}))
+        cond = "&".join(cond)
         if cols is None:
             cols = data.colnames
-        df = [[x[col] for col in cols] for x in data.where(cond)]
-        return DataFrame(df, columns = cols)
+
+        def read(start = None, stop = None):
+            if cond:
+                rows = data.read_where(cond, start = start, stop = stop)
+            else:
+                rows = data.read(start = start, stop = stop)
+            rows = _fields(rows, cols)
+            return rows if as_array else DataFrame(rows, columns = cols)
+
+        if chunksize is None:
+            return read()
+        return (read(start, start + chunksize)
+                for start in range(0, data.nrows, chunksize))
 
     def split(self, path, newpath, name, column, condition = None, \
     values = None, overwrite_tables = False):
@@ -218,4 +244,16 @@ with the overwrite_tables option")
         else:
             df2 = self.extract_data(dst, condition = dst_condition)
 
-        return merge(df1, df2, on = on, **kwargs)
\ No newline at end of file
+        return merge(df1, df2, on = on, **kwargs)
+
+def _fields(rows, cols):
+    """
+    Structured array with only the given columns of rows
+    Columns are copied whole rather than row by row
+    """
+    if list(cols) == list(rows.dtype.names):
+        return rows
+    out = np.empty(len(rows), dtype = [(c, rows.dtype[c]) for c in cols])
+    for c in cols:
+        out[c] = rows[c]
+    return out
@@ -0,0 +1,43 @@
+import os
+import shutil
+import tempfile
+import unittest
+import numpy as np
+from pandas import Timestamp, concat, date_range
+from financials.connections.hdf5 import HDF5Connection
+
+class TestHDF5Connection(unittest.TestCase):
+
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        np.random.seed(5)
+        n = 1000
+        rows = np.empty(n, dtype = [("SYMBOL", "S8"), ("TIMESTAMP", "i8"),
+                                    ("CLOSE", "f8"), ("VOLUME", "i8")])
+        rows["SYMBOL"] = np.random.choice(["A", "B", "C"], n)
+        rows["TIMESTAMP"] = date_range("2010-01-01", periods = n).asi8
+        rows["CLOSE"] = np.random.rand(n)
+        rows["VOLUME"] = np.random.randint(1, 100, n)
+        self.rows = rows
+        self.h5 = HDF5Connection(os.path.join(self.dir, "eod.h5"), mode = "w")
+        self.h5.f.create_table("/", "eod", obj = rows)
+
+    def tearDown(self):
+        self.h5.f.close()
+        shutil.rmtree(self.dir)
+
+    def test_extract_data(self):
+        rows = self.rows
+        df = self.h5.extract_data("/eod", {"SYMBOL": ("==", ["A", "B"])},
+                                  cols = ["CLOSE", "SYMBOL"], ts_col = "TIMESTAMP",
+                                  from_date = "2010-03-01", to_date = "2010-06-30")
+        ts = rows["TIMESTAMP"]
+        keep = (rows["SYMBOL"] != "C") & (ts >= Timestamp("2010-03-01").value) & \
+               (ts <= Timestamp("2010-06-30").value)
+        self.assertEqual(list(df.columns), ["CLOSE", "SYMBOL"])
+        self.assertTrue(np.array_equal(df.CLOSE.values, rows["CLOSE"][keep]))
+        array = self.h5.extract_data("/eod", {"VOLUME": (">", 50)}, as_array = True)
+        self.assertTrue(np.array_equal(array, rows[rows["VOLUME"] > 50]))
+        chunks = self.h5.extract_data("/eod", {"SYMBOL": ("==", "C")}, chunksize = 300)
+        df = concat(list(chunks), ignore_index = True)
+        self.assertTrue(np.array_equal(df.CLOSE.values, rows["CLOSE"][rows["SYMBOL"] == "C"]))
@@ -4,20 +4,33 @@ class BackTest(object):
     """
     A modular backtesting framework
     """
-    def __init__(self, source):
+    def __init__(self, source, universe = None, S = "S", TS = None):
         """
         source:
             A valid source
+        universe:
+            A point in time Universe of eligible symbols
+        S:
+            column with the symbol in the data
+        TS:
+            column with the time in the data; the index by default
         """
         self._source = source
+        self._universe = universe
+        self._S = S
+        self._TS = TS
 
     def universe(self, func, *args, **kwargs):
         """
         Create a stock universe
         func
             A function to select stocks
+        If the backtest has a point in time universe, an in_universe
+        column flags the rows of symbols eligible at that time
         """
         self._data = func(self._source, *args, **kwargs)
+        if self._universe is not None:
+            self._data = self._universe.flag(self._data, S = self._S, TS = self._TS)
 
     def ordering(self, func, *args, **kwargs):
         """
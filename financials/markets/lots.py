@@ -0,0 +1,486 @@
+"""
+Lot matching for realized profit
+
+Open lots are kept in flat arrays and linked per symbol, so matching
+trades never creates python objects per lot. Symbols are integer codes
+as assigned by the portfolio.
+
+Methods
+ * fifo - close the oldest open lots first
+ * lifo - close the latest open lots first
+ * average - close at the average cost of the open position
+
+realize matches arrays of trades in vectorized passes for all methods;
+the lot book matches fifo and lifo one trade at a time
+"""
+
+import numpy as np
+
+METHODS = ("fifo", "lifo", "average")
+
+def _grow(arr, size, fill = 0):
+    """
+    Grow an array to at least the given size, doubling the capacity
+    """
+    if len(arr) >= size:
+        return arr
+    new = np.full(max(size, 2 * len(arr)), fill, dtype = arr.dtype)
+    new[:len(arr)] = arr
+    return new
+
+
+def _order(codes):
+    """
+    Stable order of trades by symbol code
+    The position is added to the key so a quicksort keeps the order
+    of trades within a symbol; it is faster than a mergesort
+    """
+    n = len(codes)
+    return np.argsort(codes.astype(np.int64) * n + np.arange(n))
+
+
+class LotBook(object):
+    """
+    Incremental lot matching engine
+    """
+    def __init__(self, method = "fifo", symbols = 64, lots = 1024):
+        """
+        method
+            one of fifo, lifo or average
+        symbols
+            number of symbols to preallocate
+        lots
+            number of lots to preallocate
+        """
+        if method not in METHODS:
+            raise ValueError("method must be one of {0}".format(METHODS))
+        self.method = method
+        # state per symbol
+        self._pos = np.zeros(symbols)
+        self._avg = np.zeros(symbols)
+        self._head = np.full(symbols, -1, dtype = np.int64)
+        self._tail = np.full(symbols, -1, dtype = np.int64)
+        self._realized = np.zeros(symbols)
+        self._cost = np.zeros(symbols) # cost of the open lots, unsigned
+        # state per lot
+        self._lot_q = np.zeros(lots)
+        self._lot_p = np.zeros(lots)
+        self._next = np.full(lots, -1, dtype = np.int64)
+        self._prev = np.full(lots, -1, dtype = np.int64)
+        self._free = [] # lots that have been closed and could be reused
+        self._n = 0
+        self._size = 0 # number of symbol codes seen
+
+    def _reserve_symbol(self, code):
+        size = code + 1
+        self._pos = _grow(self._pos, size)
+        self._avg = _grow(self._avg, size)
+        self._head = _grow(self._head, size, -1)
+        self._tail = _grow(self._tail, size, -1)
+        self._realized = _grow(self._realized, size)
+        self._cost = _grow(self._cost, size)
+
+    def _push(self, code, q, p):
+        """
+        Open a new lot at the end of the list of a symbol
+        """
+        if self._free:
+            lot = self._free.pop()
+        else:
+            lot = self._n
+            self._n += 1
+            if lot >= len(self._lot_q):
+                size = lot + 1
+                self._lot_q = _grow(self._lot_q, size)
+                self._lot_p = _grow(self._lot_p, size)
+                self._next = _grow(self._next, size, -1)
+                self._prev = _grow(self._prev, size, -1)
+        tail = self._tail[code]
+        self._lot_q[lot] = q
+        self._lot_p[lot] = p
+        self._prev[lot] = tail
+        self._next[lot] = -1
+        if tail < 0:
+            self._head[code] = lot
+        else:
+            self._next[tail] = lot
+        self._tail[code] = lot
+        self._cost[code] += q * p
+
+    def _pop(self, code, lot):
+        """
+        Remove a closed lot from either end of the list of a symbol
+        """
+        if lot == self._head[code]:
+            self._head[code] = self._next[lot]
+        if lot == self._tail[code]:
+            self._tail[code] = self._prev[lot]
+        if self._next[lot] >= 0:
+            self._prev[self._next[lot]] = self._prev[lot]
+        if self._prev[lot] >= 0:
+            self._next[self._prev[lot]] = self._next[lot]
+        if self._head[code] < 0:
+            self._cost[code] = 0.0 # drop rounding left over by the lots
+        self._free.append(lot)
+
+    def add(self, code, Q, P):
+        """
+        Match a single trade against the open lots
+        code
+            symbol code
+        Q
+            signed quantity; positive for buy and negative for sell
+        P
+            price
+        returns the profit realized by the trade
+        """
+        if code >= self._size:
+            self._reserve_symbol(code)
+            self._size = code + 1
+        pos = self._pos[code]
+        qty = abs(Q)
+        realized = 0.0
+        if pos * Q < 0:
+            sign = 1.0 if pos > 0 else -1.0
+            closed = min(qty, abs(pos))
+            if self.method == "average":
+                realized = sign * closed * (P - self._avg[code])
+            else:
+                remaining = closed
+                while remaining > 0:
+                    lot = self._head[code] if self.method == "fifo" else self._tail[code]
+                    if lot < 0: # rounding left no lots to match
+                        break
+                    take = min(self._lot_q[lot], remaining)
+                    realized += sign * take * (P - self._lot_p[lot])
+                    self._lot_q[lot] -= take
+                    self._cost[code] -= take * self._lot_p[lot]
+                    remaining -= take
+                    if self._lot_q[lot] == 0:
+                        self._pop(code, lot)
+            pos -= sign * closed
+            qty -= closed
+        if qty > 0:
+            if self.method == "average":
+                held = abs(pos)
+                self._avg[code] = (self._avg[code] * held + P * qty) / (held + qty)
+            else:
+                self._push(code, qty, P)
+            pos += qty if Q > 0 else -qty
+        self._pos[code] = pos
+        self._realized[code] += realized
+        return realized
+
+    def add_many(self, codes, Q, P):
+        """
+        Match arrays of trades in order
+        returns an array of the profit realized by each trade
+
+        The average method is matched in a single vectorized pass.
+        fifo and lifo go through the lots one trade at a time, at a few
+        microseconds a trade; use realize_fifo and realize_lifo over
+        large arrays
+        """
+        if self.method == "average":
+            return self._add_average(codes, Q, P)
+        add = self.add
+        return np.array([add(c, q, p) for (c, q, p) in
+                         zip(np.asarray(codes).tolist(), np.asarray(Q).tolist(),
+                             np.asarray(P).tolist())])
+
+    def _add_average(self, codes, Q, P):
+        """
+        Match arrays of trades at the average cost, starting from
+        the current positions
+        """
+        codes = np.asarray(codes, dtype = np.int64)
+        if len(codes) == 0:
+            return np.zeros(0)
+        size = int(codes.max()) + 1
+        if size > self._size:
+            self._reserve_symbol(size - 1)
+            self._size = size
+        pos = self._pos[:self._size]
+        realized, last, pos_after, cost = realize_average(
+            codes, Q, P, pos, np.abs(pos) * self._avg[:self._size])
+        code = codes[last]
+        held = np.abs(pos_after[last])
+        self._pos[code] = pos_after[last]
+        with np.errstate(invalid = "ignore", divide = "ignore"):
+            self._avg[code] = np.where(held > 0, cost[last] / held, self._avg[code])
+        self._realized[:self._size] += np.bincount(codes, weights = realized,
+                                                   minlength = self._size)
+        return realized
+
+    @property
+    def position(self):
+        """
+        Net open quantity by symbol code
+        """
+        return self._pos[:self._size].copy()
+
+    @property
+    def realized(self):
+        """
+        Realized profit by symbol code
+        """
+        return self._realized[:self._size].copy()
+
+    def cost(self, codes = None):
+        """
+        Cost of the open position by symbol code
+        Negative for short positions
+        codes
+            array of symbol codes to get the cost of; all by default
+
+        The cost of the open lots is kept as they are opened and
+        closed, so no lots are read
+        """
+        if codes is None:
+            codes = slice(0, self._size)
+        pos = self._pos[codes]
+        if self.method == "average":
+            return pos * self._avg[codes]
+        return np.sign(pos) * self._cost[codes]
+
+
+def realize_fifo(codes, Q, P):
+    """
+    Vectorized FIFO realized profit for arrays of trades
+
+    codes
+        array of symbol codes
+    Q
+        array of signed quantities
+    P
+        array of prices
+    returns an array of the profit realized by each trade
+
+    Under FIFO, the k-th unit bought in a symbol is always matched with
+    the k-th unit sold, whatever the order of the trades. So the profit
+    realized by a trade is the change in the value of units sold less
+    the value of units bought over the newly matched units. The value
+    of the first x units bought (or sold) is piecewise linear in x
+    and is evaluated by interpolation over the cumulative sums
+    """
+    codes = np.asarray(codes)
+    Q = np.asarray(Q, dtype = np.float64)
+    P = np.asarray(P, dtype = np.float64)
+    n = len(Q)
+    if n == 0:
+        return np.zeros(0)
+    order = _order(codes)
+    c, q, p = codes[order], Q[order], P[order]
+    start = np.r_[True, c[1:] != c[:-1]]
+    group = np.cumsum(start) - 1
+    bought, sold = np.where(q > 0, q, 0.0), np.where(q < 0, -q, 0.0)
+    B, S = np.cumsum(bought), np.cumsum(sold)
+    BV, SV = np.cumsum(bought * p), np.cumsum(sold * p)
+    # cumulative quantities at the start of each symbol
+    B0 = (B - bought)[start][group]
+    S0 = (S - sold)[start][group]
+    matched = np.minimum(B - B0, S - S0)
+    before = np.minimum(B - B0 - bought, S - S0 - sold)
+
+    def value(x, cum_q, cum_v, mask, offset):
+        # value of the first x units on one side within each symbol
+        xp = np.r_[0.0, cum_q[mask]]
+        fp = np.r_[0.0, cum_v[mask]]
+        return np.interp(x + offset, xp, fp)
+
+    buys, sells = bought > 0, sold > 0
+    realized = ((value(matched, S, SV, sells, S0) - value(before, S, SV, sells, S0)) -
+                (value(matched, B, BV, buys, B0) - value(before, B, BV, buys, B0)))
+    result = np.empty(n)
+    result[order] = realized
+    return result
+
+
+def _stack_cost(after, before, p, first):
+    """
+    Cost of the lots open on one side after each trade under LIFO
+    after, before
+        size of the side after and before each trade; never negative
+    p
+        array of prices
+    first
+        index of the first trade of the symbol of each trade
+
+    Lots form a stack ordered by level, so the units below the size
+    after a trade were all opened by the last trade that started at or
+    below it; the cost is that of the stack before the opening trade
+    and the units it added. Opening trades of trades that reduce the
+    side are found by binary lifting over a table of running minimums.
+    The costs then refer back to earlier costs and are summed by
+    pointer jumping, in log2(n) vectorized passes
+    """
+    n = len(after)
+    opener = np.arange(n)
+    down = np.flatnonzero(before > after)
+    if len(down):
+        # minimum of before over windows of 2**k trades ending at each trade
+        span = (np.arange(n) - first).max() + 1
+        levels = [before]
+        while 2 ** len(levels) <= span:
+            w = 2 ** (len(levels) - 1)
+            m = levels[-1].copy()
+            m[w:] = np.minimum(m[w:], levels[-1][:-w])
+            levels.append(m)
+        level, lo, at = after[down], first[down], down - 1
+        for k in reversed(range(len(levels))):
+            w = 2 ** k
+            skip = (at - w + 1 >= lo) & (levels[k][np.maximum(at, 0)] > level)
+            at = np.where(skip, at - w, at)
+        opener[down] = at
+    cost = (after - before[opener]) * p[opener]
+    prior = np.where(opener > first, opener - 1, -1)
+    active = np.flatnonzero(prior >= 0)
+    while len(active):
+        cost[active] += cost[prior[active]]
+        prior[active] = prior[prior[active]]
+        active = active[prior[active] >= 0]
+    return cost
+
+
+def realize_lifo(codes, Q, P):
+    """
+    Vectorized LIFO realized profit for arrays of trades
+
+    codes
+        array of symbol codes
+    Q
+        array of signed quantities
+    P
+        array of prices
+    returns an array of the profit realized by each trade
+
+    Long and short lots are taken separately, each side being the part
+    of the running position above or below zero. A trade reducing a
+    side realizes the value of the units closed less the fall in the
+    cost of the lots open on that side, found by _stack_cost
+    """
+    codes = np.asarray(codes)
+    Q = np.asarray(Q, dtype = np.float64)
+    P = np.asarray(P, dtype = np.float64)
+    n = len(Q)
+    if n == 0:
+        return np.zeros(0)
+    order = _order(codes)
+    c, q, p = codes[order], Q[order], P[order]
+    start = np.r_[True, c[1:] != c[:-1]]
+    group = np.cumsum(start) - 1
+    first = np.flatnonzero(start)[group]
+    total = np.cumsum(q)
+    after = total - (total - q)[start][group]
+    before = after - q
+    realized = np.zeros(n)
+    for sign in (1.0, -1.0):
+        size, size_before = np.maximum(sign * after, 0.0), np.maximum(sign * before, 0.0)
+        cost = _stack_cost(size, size_before, p, first)
+        cost_before = np.where(start, 0.0, np.r_[0.0, cost[:-1]])
+        closed = size_before - size
+        realized += np.where(closed > 0, sign * (closed * p - (cost_before - cost)), 0.0)
+    result = np.empty(n)
+    result[order] = realized
+    return result
+
+
+def _scan(a, b, span = None):
+    """
+    Solve y[t] = a[t] * y[t-1] + b[t] starting from zero
+    Pairs of steps are combined by recursive doubling, so the
+    recurrence takes log2(n) vectorized passes
+    span
+        longest run of steps without a zero a, if known; no more
+        passes than needed to cover it are made
+    """
+    a, y = a.copy(), b.copy()
+    span = len(y) if span is None else span
+    k = 1
+    while k < span:
+        y[k:] = y[k:] + a[k:] * y[:-k]
+        a[k:] = a[k:] * a[:-k]
+        k *= 2
+    return y
+
+
+def realize_average(codes, Q, P, pos = None, cost = None):
+    """
+    Vectorized average cost realized profit for arrays of trades
+
+    codes
+        array of symbol codes
+    Q
+        array of signed quantities
+    P
+        array of prices
+    pos
+        open quantity by symbol code before the trades; none by default
+    cost
+        cost of the open quantity by symbol code, as a positive number
+    returns the profit realized by each trade, the index of the last
+    trade of each symbol and the open quantity and cost after each trade
+
+    Positions are running sums of the quantities. The cost of the open
+    position follows a linear recurrence: adding to a position adds to
+    the cost, reducing it scales the cost down by the quantity left and
+    opening or reversing a position starts the cost afresh. The
+    recurrence is solved for all trades at once by _scan
+    """
+    codes = np.asarray(codes, dtype = np.int64)
+    Q = np.asarray(Q, dtype = np.float64)
+    P = np.asarray(P, dtype = np.float64)
+    n = len(Q)
+    if n == 0:
+        return np.zeros(0), np.zeros(0, dtype = np.int64), np.zeros(0), np.zeros(0)
+    order = _order(codes)
+    c, q, p = codes[order], Q[order], P[order]
+    start = np.r_[True, c[1:] != c[:-1]]
+    group = np.cumsum(start) - 1
+    total = np.cumsum(q)
+    pos0 = np.zeros(n) if pos is None else np.asarray(pos, dtype = np.float64)[c]
+    cost0 = np.zeros(n) if cost is None else np.asarray(cost, dtype = np.float64)[c]
+    after = (total - (total - q)[start][group]) + pos0
+    before = after - q
+    opposite = before * q < 0
+    closed = np.where(opposite, np.minimum(np.abs(q), np.abs(before)), 0.0)
+    opened = np.abs(q) - closed
+    with np.errstate(invalid = "ignore", divide = "ignore"):
+        a = np.where(~opposite, 1.0,
+                     np.where(opened > 0, 0.0, np.abs(after) / np.abs(before)))
+    b = p * opened
+    # the first trade of a symbol starts from the cost held before
+    b[start] += a[start] * cost0[start]
+    a[start] = 0.0
+    C = _scan(a, b, np.diff(np.r_[np.flatnonzero(start), n]).max())
+    prior = np.where(start, cost0, np.r_[0.0, C[:-1]])
+    with np.errstate(invalid = "ignore", divide = "ignore"):
+        realized = np.where(opposite, np.sign(before) * closed *
+                            (p - prior / np.abs(before)), 0.0)
+    result = np.empty(n)
+    result[order] = realized
+    last = order[np.r_[start[1:], True]]
+    pos_after, cost_after = np.empty(n), np.empty(n)
+    pos_after[order], cost_after[order] = after, C
+    return result, last, pos_after, cost_after
+
+
+def realize(codes, Q, P, method = "fifo"):
+    """
+    Realized profit for each of an array of trades
+    codes
+        array of symbol codes
+    Q
+        array of signed quantities; positive for buy and negative for sell
+    P
+        array of prices
+    method
+        one of fifo, lifo or average
+    """
+    if method == "fifo":
+        return realize_fifo(codes, Q, P)
+    if method == "lifo":
+        return realize_lifo(codes, Q, P)
+    if method == "average":
+        return realize_average(codes, Q, P)[0]
+    raise ValueError("method must be one of {0}".format(METHODS))
@@ -1,3 +1,29 @@
+import numpy as np
+from pandas import Series, DataFrame
+from pandas.tseries.frequencies import to_offset
+from financials.markets.lots import LotBook, realize
+
+# Cash entries treated as capital brought in or taken out of the portfolio
+_FLOWS = ["Opening Balance", "Capital", "Cash withdrawn"]
+
+def _bar_ends(index, freq = None):
+    """
+    Last nanosecond of each bar of a datetime index
+    A bar lasts until the next one starts; the last bar lasts for
+    the frequency or else as long as the bar before it
+    """
+    starts = index.asi8
+    if len(starts) == 0:
+        return starts
+    freq = freq or index.freq
+    if freq is not None:
+        end = (index[-1] + to_offset(freq)).value
+    elif len(starts) > 1:
+        end = 2 * starts[-1] - starts[-2]
+    else:
+        end = index[-1].normalize().value + np.int64(86400 * 10**9)
+    return np.r_[starts[1:], end] - 1
+
 class Metrics(object):
     """
     Metrics package for a portfolio
@@ -7,6 +33,24 @@ class Metrics(object):
         Initialize metrics with a portfolio
         """
         self._pf = portfolio
+        self._books = {}
+        self._cache = None # cached equity curve
+        self._price = None
+
+    def _book(self, method):
+        """
+        Lot book for the method, updated with trades added since
+        the last call
+        """
+        store, symbols = self._pf._trades, self._pf._symbols
+        book, done, known = self._books.get(method, (None, 0, None))
+        if book is None or known is not symbols or done > len(store):
+            book, done = LotBook(method), 0
+        n = len(store)
+        if done < n:
+            book.add_many(store["S"][done:], store["Q"][done:], store["P"][done:])
+        self._books[method] = (book, n, symbols)
+        return book
 
     def mtm(self, price, **kwargs):
         """
@@ -14,13 +58,43 @@ class Metrics(object):
         """
         return self._pf.valuation(price).V.sum() + self._pf.summary.V.sum()
 
-    def realized_profit(self, **kwargs):
+    def realized_profit(self, method = "fifo", by_symbol = False, batch = False,
+                        **kwargs):
         """
-        Calculated the realized profit
+        Calculated the realized profit by matching trades against open lots
+        method
+            fifo - first in first out
+            lifo - last in first out
+            average - average cost of the open position
+        by_symbol
+            If True, return the realized profit for each symbol as series
+        batch
+            If True, match all the trades in a single pass instead of
+            updating the lots with the trades added since the last call
         """
-        sale_qty = self._pf.trades.groupby(["S", "M"]).Q.sum().xs("SELL", level = "M")
-        price_diff = self._pf.price().SELL - self._pf.price().BUY
-        return (price_diff * -sale_qty).sum()
+        store = self._pf._trades
+        if batch and len(store) == 0:
+            profit = np.zeros(len(self._pf._symbols))
+        elif batch:
+            codes = store["S"]
+            profit = realize(codes, store["Q"], store["P"], method = method)
+            profit = np.bincount(codes, weights = profit, minlength = len(self._pf._symbols))
+        else:
+            profit = self._book(method).realized
+        if by_symbol:
+            symbols = self._pf._symbols.values()
+            return Series(profit, index = symbols[:len(profit)]).sort_index()
+        return profit.sum()
+
+    def stream(self, price = None, method = "fifo"):
+        """
+        Create a streaming mark to market engine for the portfolio
+        price
+            initial prices of the stocks as series
+        method
+            lot matching method for the cost of open positions
+        """
+        return MarkToMarket(self._pf, price = price, method = method)
 
     def unrealized_profit(self, price, **kwargs):
         """
@@ -28,45 +102,328 @@ class Metrics(object):
         price
             A dataframe containing the present prices
         """
-        return self.mtm(price) - self.realized_profit()
+        return self.mtm(price) - self.realized_profit(**kwargs)
+
+    def equity(self, price = None, freq = None):
+        """
+        Equity curve of the portfolio
+        price
+            dataframe of prices with datetime index and symbols as columns
+            If None, the prices of the previous call are used
+        freq
+            frequency of the curve as a pandas offset string
+            By default, the dates of the price dataframe are used
+
+        Equity on a date is the cash balance plus the value of holdings
+        at the end of that date. The curve is cached and computed again
+        only when trades, cash entries or the arguments change
+        """
+        return self._curve(price, freq).equity
+
+    def returns(self, price = None, freq = None):
+        """
+        Periodic returns from the equity curve, net of capital flows
+        """
+        return self._curve(price, freq).returns.iloc[1:]
+
+    def _curve(self, price = None, freq = None):
+        """
+        Build or fetch the cached equity curve along with capital
+        flows and returns
+        """
+        if price is None:
+            if self._price is None:
+                raise ValueError("Price data required to build the equity curve")
+            price = self._price
+        key = (freq, self._pf._trades.version, self._pf._cash.version)
+        if self._cache is not None and self._cache[0] is price and self._cache[1] == key:
+            return self._cache[2]
+        P = price if freq is None else price.resample(freq).last()
+        P = P.ffill()
+        # everything upto the end of each bar is included
+        cutoff = _bar_ends(P.index, freq)
+
+        ledger = self._pf.cash_ledger()
+        at = np.searchsorted(ledger.index.asi8, cutoff, "right") - 1
+        pick = lambda x: np.where(at >= 0, x[np.maximum(at, 0)], 0.0)
+        cash = pick(ledger.balance.values)
+        flows = np.where(ledger.I.isin(_FLOWS).values, ledger.A.values, 0.0).cumsum()
+        flows = pick(flows) if len(flows) else np.zeros(len(at))
 
-    def profit(self, **kwargs):
+        columns = np.array([self._pf._symbols.get(c) for c in P.columns], dtype = np.int64)
+        held = self._pf._snapshot(cutoff)[0]
+        if held.shape[1] == 0:
+            Q = np.zeros(P.shape)
+        else:
+            Q = np.where(columns >= 0, held[:, np.maximum(columns, 0)], 0.0)
+        value = np.nansum(Q * P.values, axis = 1)
+
+        df = DataFrame({"cash": cash, "value": value, "equity": cash + value,
+                        "flows": np.diff(np.r_[0.0, flows])}, index = P.index,
+                       columns = ["cash", "value", "equity", "flows"])
+        previous = df.equity.shift(1)
+        df["returns"] = (df.equity - df.flows) / previous - 1
+        self._cache = (price, key, df)
+        self._price = price
+        return df
+
+    def profit(self, price = None, freq = None, **kwargs):
         """
         Calculate the profit of the portfolio
-        mode:
-        'realized' - calculate only on completed trades
-        'unrealized' - calculate only on holdings
-        'indicative' - calculate both realized and unrealized
+        Equity at the end of the curve less the capital brought in
         """
-        df = self._pf.cash_ledger()
-        expenses = df[df.I == "Expense"].A.sum()
-        return self.mtm + expenses
+        df = self._curve(price, freq)
+        if len(df) == 0:
+            return 0.0
+        return df.equity.iloc[-1] - df.flows.sum()
 
-    def mean(self, by = "TS", **kwargs):
+    def mean(self, price = None, freq = None, **kwargs):
         """
         Calculate the mean return
-        by
-            Metric by which the return is to be calculated
-
         """
-        pass
+        return self.returns(price, freq).mean()
 
-    def std(self, by = "TS", **kwargs):
+    def std(self, price = None, freq = None, **kwargs):
         """
-        Calculate the standard deviation
+        Calculate the standard deviation of returns
         """
-        pass
+        return self.returns(price, freq).std()
 
-    def sharpe(self, by = "TS", **kwargs):
+    def sharpe(self, price = None, freq = None, risk_free = 0, **kwargs):
         """
         Calculate the Sharpe Ratio
+        risk_free
+            risk free return for the period
         """
-        return self.mean(by = by)/self.std(by = by)
+        return (self.mean(price, freq) - risk_free) / self.std(price, freq)
 
-    def ROC(self, **kwargs):
+    def sortino(self, price = None, freq = None, risk_free = 0, **kwargs):
+        """
+        Calculate the Sortino Ratio
+        Only returns below the risk free return count towards risk
+        """
+        R = self.returns(price, freq) - risk_free
+        downside = np.sqrt((np.minimum(R, 0) ** 2).mean())
+        return R.mean() / downside
+
+    def drawdown(self, price = None, freq = None, **kwargs):
+        """
+        Drawdown of the equity curve from its running peak
+        """
+        equity = self.equity(price, freq)
+        return equity / equity.cummax() - 1
+
+    def max_drawdown(self, price = None, freq = None, **kwargs):
+        """
+        Maximum drawdown of the equity curve
+        """
+        return self.drawdown(price, freq).min()
+
+    def ROC(self, price = None, freq = None, **kwargs):
         """
         Calculate the Return on Capital
         """
-        df = self._pf.cash_ledger()
-        capital = df[df.I == "Capital"].A.sum() + 0.0
-        return self.profit/capital
\ No newline at end of file
+        df = self._curve(price, freq)
+        capital = df.flows[df.flows > 0].sum() + 0.0
+        return self.profit(price, freq) / capital
+
+
+class MarkToMarket(object):
+    """
+    Streaming mark to market of a portfolio
+
+    Prices are fed as ticks and the mark to market, unrealized profit
+    and exposure are updated in constant time per tick from the
+    positions maintained by the portfolio. Positions are picked up again
+    whenever new trades are added to the portfolio.
+
+    Unrealized profit is measured against the cost of the lots still
+    open, matched by the given method as in realized_profit
+    """
+    def __init__(self, portfolio, price = None, method = "fifo"):
+        """
+        portfolio
+            the portfolio to be marked
+        price
+            initial prices of the stocks as series
+        method
+            lot matching method for the cost of open positions
+            fifo, lifo or average
+        """
+        self._pf = portfolio
+        self._method = method
+        self._version = None
+        self._symbols = None
+        self._done = 0 # number of trades taken into the positions
+        self._P = np.zeros(0)
+        self._unknown = {} # prices for symbols not yet in the portfolio
+        self.sync()
+        if price is not None:
+            self.ticks(price.index, price.values)
+
+    def __repr__(self):
+        return "MTM: {M}, Unrealized: {U}, Exposure: {E}".format \
+                (M = self.mtm, U = self.unrealized, E = self.exposure)
+
+    def sync(self):
+        """
+        Reload positions from the portfolio and recompute the totals
+        """
+        symbols = self._pf._symbols
+        if symbols is not self._symbols:
+            self._P = np.zeros(0) # trades were cleared and symbols recoded
+        self._symbols = symbols
+        n = len(self._P)
+        self._Q, self._basis, self._V = np.zeros(n), np.zeros(n), np.zeros(n)
+        self._value = self._exposure = self._unrealized = self._cash_value = 0.0
+        self._update(np.arange(len(self._pf._positions)))
+
+    def _update(self, codes):
+        """
+        Reload the positions of the given symbols from the portfolio
+        and adjust the totals by the change
+        codes
+            array of unique symbol codes
+        """
+        store = self._pf._positions
+        n = len(store)
+        if len(self._P) < n:
+            grow = n - len(self._P)
+            self._P = np.r_[self._P, np.full(grow, np.nan)]
+            self._Q, self._basis, self._V = [np.r_[x, np.zeros(grow)] for x in
+                                             (self._Q, self._basis, self._V)]
+            for s, p in list(self._unknown.items()):
+                code = self._symbols.get(s)
+                if 0 <= code < n:
+                    self._P[code] = p
+                    del self._unknown[s]
+        Q = store["Q"][codes]
+        cost = self._pf.metrics._book(self._method).cost(codes)
+        with np.errstate(invalid = "ignore", divide = "ignore"):
+            basis = np.where(Q != 0, cost / Q, 0.0)
+        V = store["V"][codes]
+        self._cash_value += (V - self._V[codes]).sum()
+        self._V[codes] = V
+        self._mark(codes, Q, basis, self._P[codes])
+        self._done = len(self._pf._trades)
+        self._version = store.version
+
+    def _mark(self, codes, Q, basis, P):
+        """
+        Replace the quantity, cost basis and price of the given symbols
+        and adjust the totals by the difference
+        """
+        for sign, q, b, p in [(-1, self._Q[codes], self._basis[codes], self._P[codes]),
+                              (1, Q, basis, P)]:
+            priced = ~np.isnan(p)
+            value = np.where(priced, q * p, 0.0)
+            self._value += sign * value.sum()
+            self._exposure += sign * np.abs(value).sum()
+            self._unrealized += sign * np.where(priced, q * (p - b), 0.0).sum()
+        self._Q[codes], self._basis[codes], self._P[codes] = Q, basis, P
+
+    def _check(self):
+        """
+        Pick up trades added since the last check; only the symbols
+        traded are reloaded
+        """
+        if self._version == self._pf._positions.version:
+            return
+        trades = self._pf._trades
+        if self._pf._symbols is not self._symbols or len(trades) < self._done:
+            self.sync()
+        else:
+            self._update(np.unique(trades["S"][self._done:]))
+
+    def tick(self, S, price):
+        """
+        Update the price of a symbol
+        S
+            symbol
+        price
+            latest price
+        returns the mark to market of the portfolio
+        """
+        self._check()
+        code = self._pf._symbols.get(S)
+        if code < 0 or code >= len(self._Q):
+            self._unknown[S] = price
+            return self.mtm
+        old = self._P[code]
+        q = self._Q[code]
+        if old != old: # first price for the symbol
+            old_value, old_unrealized = 0.0, 0.0
+        else:
+            old_value, old_unrealized = q * old, q * (old - self._basis[code])
+        value = q * price
+        self._value += value - old_value
+        self._exposure += abs(value) - abs(old_value)
+        self._unrealized += q * (price - self._basis[code]) - old_unrealized
+        self._P[code] = price
+        return self.mtm
+
+    def ticks(self, S, price):
+        """
+        Update the prices of many symbols at once
+        S
+            array of symbols
+        price
+            array of prices; the last price of each symbol is kept
+
+        The totals are adjusted by the change in price of the symbols
+        ticked, as in tick
+        """
+        self._check()
+        S = np.asarray(S, dtype = object)
+        price = np.asarray(price, dtype = np.float64)
+        if len(S) == 0:
+            return self.mtm
+        uniques, index = np.unique(S[::-1], return_index = True)
+        last = price[::-1][index]
+        codes = np.array([self._pf._symbols.get(s) for s in uniques], dtype = np.int64)
+        known = (codes >= 0) & (codes < len(self._P))
+        for s, p in zip(uniques[~known], last[~known]):
+            self._unknown[s] = p
+        codes = codes[known]
+        self._mark(codes, self._Q[codes], self._basis[codes], last[known])
+        return self.mtm
+
+    @property
+    def mtm(self):
+        """
+        Mark to market of the portfolio
+        """
+        self._check()
+        return self._value + self._cash_value
+
+    @property
+    def unrealized(self):
+        """
+        Unrealized profit of the portfolio
+        """
+        self._check()
+        return self._unrealized
+
+    @property
+    def exposure(self):
+        """
+        Gross exposure of the portfolio
+        """
+        self._check()
+        return self._exposure
+
+    @property
+    def prices(self):
+        """
+        Latest prices by symbol
+        """
+        return Series(self._P, index = self._pf._symbols.values()[:len(self._P)])
+
+    @property
+    def symbol_unrealized(self):
+        """
+        Unrealized profit by symbol
+        """
+        self._check()
+        U = np.where(np.isnan(self._P), 0.0, self._Q * (self._P - self._basis))
+        return Series(U, index = self._pf._symbols.values()[:len(U)])
@@ -1,8 +1,38 @@
-from pandas import Series, DataFrame
+import numpy as np
+from pandas import DataFrame
 from numpy import array, zeros
-from collections import Iterable
 
-def stoploss(data,percentage,price_column,order_column,**kwargs):
+# Column names for the extra information added to protective orders
+_TRAIL = "Trail"
+_LEG = "Leg"
+_OCO = "OCO"
+
+def _levels(data, percentage, price_column, order_column, Pair = None):
+    """
+    Arrays needed to price protective orders
+    returns a 4-tuple with the buy mask, prices, fractions of price and
+    the mapping of each order code to its opposite
+    """
+    buy, sell = Pair if Pair else ("BUY", "SELL")
+    is_buy = (data[order_column] == buy).values
+    price = np.asarray(data[price_column], dtype = np.float64)
+    p = np.asarray(percentage, dtype = np.float64) * 0.01 + zeros(len(price))
+    return is_buy, price, p, {buy: sell, sell: buy}
+
+def _fill(df, order_column, opposite, **kwargs):
+    """
+    Flip the order codes and fill the columns given in kwargs
+    """
+    df[order_column] = df[order_column].map(opposite)
+    if kwargs.get("ORDERCODE_COL") and kwargs.get("STOPLOSS_CODE"):
+        df[kwargs["ORDERCODE_COL"]] = kwargs["STOPLOSS_CODE"]
+    for k, v in kwargs.items():
+        if k in df.columns and k != order_column:
+            df[k] = v
+    return df
+
+def stoploss(data, percentage, price_column, order_column, trailing = False,
+             **kwargs):
     """
     Given order data and a percentage, create a stop loss order
 
@@ -19,6 +49,9 @@ def stoploss(data,percentage,price_column,order_column,**kwargs):
     order_column - column that contains the order type BUY/SELL. If orders have
     different codes other than BUY/SELL, use kwargs
 
+    trailing - If True, a Trail column is added with the distance at which
+    the stop follows the best price after the order
+
 
     **kwargs**
 
@@ -36,8 +69,8 @@ def stoploss(data,percentage,price_column,order_column,**kwargs):
     value.
 
     StopLoss calculation
-     * Long orders = price * (1 + percentage)
-     * Short orders = price * (1 - percentage)
+     * Long orders = price * (1 - percentage)
+     * Short orders = price * (1 + percentage)
 
     >>> df = DataFrame([list("ABCD"), list("WXYZ"),range(1,5),["BUY","SELL","BUY","SELL"]]).transpose()
     >>> df.columns = ["Symbol", "Remarks", "Price", "OrderType"]
@@ -52,19 +85,289 @@ def stoploss(data,percentage,price_column,order_column,**kwargs):
     >>> df2["OrderType"] = ["S", "B", "S", "B"]
     >>> all(df2 == stoploss(df,1,"Price","OrderType", Pair = ["B", "S"]))
     True
+    >>> stoploss(df,1,"Price","OrderType", Pair = ["B", "S"]).Price.round(2).tolist()
+    [0.99, 2.02, 2.97, 4.04]
+    >>> stoploss(df,10,"Price","OrderType", Pair = ["B", "S"], trailing = True).Trail.round(2).tolist()
+    [0.1, 0.2, 0.3, 0.4]
 
     """
-    if kwargs.get("Pair"):
-        Pair = kwargs["Pair"]
-        s = Series({Pair[0]:Pair[1], Pair[1]:Pair[0]})
-    else:
-        s = Series({"BUY": "SELL", "SELL": "BUY"})
-    p = percentage * 0.01
-    if not isinstance(p, Iterable):
-        p = [p] * len(data)
-    SL = [price *(1-per) if x==s[1] else price*(1+per) for (price,x,per) in
-          zip(data[price_column], data[order_column], p)]
+    is_buy, price, p, opposite = _levels(data, percentage, price_column,
+                                         order_column, kwargs.pop("Pair", None))
     df = data.copy()
-    df[price_column] = SL
-    df[order_column] = df[order_column].map(s)
-    return df
+    df[price_column] = price * np.where(is_buy, 1 - p, 1 + p)
+    if trailing:
+        df[_TRAIL] = price * p
+    return _fill(df, order_column, opposite, **kwargs)
+
+def takeprofit(data, percentage, price_column, order_column, **kwargs):
+    """
+    Given order data and a percentage, create a take profit order
+    The arguments are the same as stoploss
+
+    TakeProfit calculation
+     * Long orders = price * (1 + percentage)
+     * Short orders = price * (1 - percentage)
+
+    >>> df = DataFrame({"Price": [100, 200], "OrderType": ["BUY", "SELL"]})
+    >>> tp = takeprofit(df, 5, "Price", "OrderType")
+    >>> list(tp.Price), list(tp.OrderType)
+    ([105.0, 190.0], ['SELL', 'BUY'])
+    """
+    is_buy, price, p, opposite = _levels(data, percentage, price_column,
+                                         order_column, kwargs.pop("Pair", None))
+    df = data.copy()
+    df[price_column] = price * np.where(is_buy, 1 + p, 1 - p)
+    return _fill(df, order_column, opposite, **kwargs)
+
+def bracket(data, stop, target, price_column, order_column, trailing = False,
+            **kwargs):
+    """
+    Given order data, create a bracket of a stop loss and a take profit
+    order for each order. Both legs are generated in a single pass; the
+    legs of an order follow each other and share the same OCO number so
+    that filling one cancels the other
+
+    stop - percentage of stop loss, as in stoploss
+    target - percentage of take profit, as in takeprofit
+    trailing - If True, the stop loss legs are trailing stops
+
+    Leg column has STOP or TARGET and OCO column the position of the
+    order in data. Other arguments are the same as stoploss
+
+    >>> df = DataFrame({"Price": [100, 200], "OrderType": ["BUY", "SELL"]})
+    >>> br = bracket(df, 2, 5, "Price", "OrderType")
+    >>> list(br.Price)
+    [98.0, 105.0, 204.0, 190.0]
+    >>> list(br.Leg), list(br.OCO), list(br.OrderType)
+    (['STOP', 'TARGET', 'STOP', 'TARGET'], [0, 0, 1, 1], ['SELL', 'SELL', 'BUY', 'BUY'])
+    """
+    Pair = kwargs.pop("Pair", None)
+    is_buy, price, sl, opposite = _levels(data, stop, price_column, order_column, Pair)
+    tp = np.asarray(target, dtype = np.float64) * 0.01 + zeros(len(price))
+    sign = np.where(is_buy, 1.0, -1.0)
+    levels = np.column_stack([price * (1 - sign * sl), price * (1 + sign * tp)])
+    n = len(data)
+    df = data.iloc[np.repeat(np.arange(n), 2)].copy()
+    df[price_column] = levels.ravel()
+    df[_LEG] = np.tile(["STOP", "TARGET"], n)
+    df[_OCO] = np.repeat(np.arange(n), 2)
+    if trailing:
+        df[_TRAIL] = np.column_stack([price * sl, np.nan + zeros(n)]).ravel()
+    return _fill(df, order_column, opposite, **kwargs)
+
+# Number of elements summarized by each entry of the next level of a
+# _Levels structure and the number of orders scanned together
+_BLOCK = 64
+_CHUNK = 1 << 14
+
+class _Levels(object):
+    """
+    Block minima of an array at successive levels, so that the first
+    element at or below a value after a position is found by scanning
+    upto _BLOCK elements a level; up through the levels till a block
+    holds a match and then down into it
+    """
+    def __init__(self, values):
+        self.levels = [values]
+        while len(values) > _BLOCK:
+            pad = -len(values) % _BLOCK
+            values = np.r_[values, np.full(pad, np.inf)].reshape(-1, _BLOCK).min(axis = 1)
+            self.levels.append(values)
+
+    def _scan(self, k, start, stop, x, strict):
+        """
+        First position between start and stop in level k with a value
+        below x; stop - start must not exceed _BLOCK
+        returns the positions and a mask of positions found
+        """
+        values = self.levels[k]
+        idx = start[:, None] + np.arange(_BLOCK)
+        valid = idx < stop[:, None]
+        v = values[np.minimum(idx, len(values) - 1)]
+        hit = (v < x[:, None] if strict else v <= x[:, None]) & valid
+        return start + hit.argmax(axis = 1), hit.any(axis = 1)
+
+    def first(self, start, end, x, strict = False):
+        """
+        Index of the first element at or below x (strictly below if
+        strict) from start upto end; -1 if there is none
+        """
+        result = np.full(len(start), -1, dtype = np.int64)
+        for i in range(0, len(start), _CHUNK):
+            s = slice(i, i + _CHUNK)
+            result[s] = self._first(start[s], end[s], x[s], strict)
+        return result
+
+    def _first(self, start, end, x, strict):
+        found = np.full(len(start), -1, dtype = np.int64)
+        level = np.zeros(len(start), dtype = np.int64)
+        pending = np.flatnonzero(start < end)
+        pos, size = start[pending].copy(), 1
+        for k in range(len(self.levels)):
+            if len(pending) == 0:
+                break
+            limit = -(-end[pending] // size)
+            stop = np.minimum((pos // _BLOCK + 1) * _BLOCK, limit)
+            if k == len(self.levels) - 1:
+                stop = np.minimum(pos + _BLOCK, limit)
+            at, hit = self._scan(k, pos, stop, x[pending], strict)
+            found[pending[hit]], level[pending[hit]] = at[hit], k
+            pending, pos = pending[~hit], pos[~hit] // _BLOCK + 1
+            size *= _BLOCK
+        # descend into the blocks that hold a match
+        for k in range(len(self.levels) - 1, 0, -1):
+            down = np.flatnonzero((level == k) & (found >= 0))
+            if len(down):
+                start = found[down] * _BLOCK
+                stop = np.minimum(start + _BLOCK, len(self.levels[k - 1]))
+                found[down] = self._scan(k - 1, start, stop, x[down], strict)[0]
+                level[down] = k - 1
+        found[found >= end] = -1
+        return found
+
+def _trailing(low, high, start, end, x, trail, down, strict = False):
+    """
+    First bar at which a trailing stop triggers along with the stop
+    price at that bar
+    The stop follows the best price of the previous bars at the
+    distance trail, and never moves back
+    """
+    found = np.full(len(start), -1, dtype = np.int64)
+    sign = 1.0 if down else -1.0
+    # work on prices of a long position; short positions are mirrored
+    lo, hi = (low, high) if down else (-high, -low)
+    level = sign * x
+    pending = np.flatnonzero(start < end)
+    j = start[pending].copy()
+    stop = level[pending]
+    while len(pending):
+        hit = lo[j] < stop if strict else lo[j] <= stop
+        found[pending[hit]] = j[hit]
+        level[pending[hit]] = stop[hit]
+        stop = np.maximum(stop, hi[j] - trail[pending])
+        j = j + 1
+        keep = ~hit & (j < end[pending])
+        pending, j, stop = pending[keep], j[keep], stop[keep]
+    return found, sign * level
+
+def triggers(orders, bars, price_column, order_column, symbol_column = "Symbol",
+             start_column = None, OPEN = False, **kwargs):
+    """
+    Simulate stop loss, take profit and bracket orders over OHLC bars
+    and find the first bar at which each order triggers along with the
+    fill price
+
+    orders - DataFrame of pending orders as generated by stoploss,
+    takeprofit or bracket
+
+    bars - DataFrame of bars with datetime index, a symbol column and
+    columns O, H, L, C
+
+    price_column - column with the trigger price of the orders
+
+    order_column - column with the order type BUY/SELL of the orders
+
+    symbol_column - column with the symbol in both orders and bars
+
+    start_column - column of orders with the time after which the order
+    is live. By default, orders are live from the first bar
+
+    OPEN - whether to discard triggers when the High or Low of the bar
+    equals the trigger price, as in profit
+
+    **kwargs**
+
+    Pair - list - keyword for BUY,SELL
+
+    Orders are stops unless the Leg column says TARGET, in which case
+    they are limit orders. A price is hit by a bar when it lies in the
+    range between the Low and the High, as in profit. A sell stop or a
+    buy limit triggers at the first bar whose Low reaches the price and
+    is filled at the price or at the Open if the bar opens beyond it;
+    buy stops and sell limits are the mirror image on the High. Orders
+    with a Trail column follow the best price of the previous bars.
+    Legs sharing an OCO number cancel each other; if both trigger on
+    the same bar the stop is taken.
+
+    returns a DataFrame with the same index as orders and columns
+     * TS - time of the bar at which the order is filled
+     * Fill - fill price
+     * Status - filled, cancelled or open
+
+    >>> from pandas import DatetimeIndex
+    >>> bars = DataFrame({"Symbol": "A", "O": [100, 101, 97, 104], \
+        "H": [102, 103, 99, 106], "L": [99, 100, 95, 103], "C": [101, 102, 98, 105]}, \
+        index = DatetimeIndex(["2014-01-01", "2014-01-02", "2014-01-03", "2014-01-06"]))
+    >>> orders = bracket(DataFrame({"Symbol": ["A"], "Price": [100], "M": ["BUY"]}), 2, 5, "Price", "M")
+    >>> result = triggers(orders, bars, "Price", "M")
+    >>> result.Fill.tolist(), result.Status.tolist()
+    ([97.0, nan], ['filled', 'cancelled'])
+    >>> result.TS.iloc[0]
+    Timestamp('2014-01-03 00:00:00')
+    """
+    from pandas import factorize, NaT
+    from financials.utilities.store import to_ns_array
+    Pair = kwargs.get("Pair")
+    buy, sell = Pair if Pair else ("BUY", "SELL")
+    n = len(orders)
+    # sort bars by symbol and time so that each symbol is a segment
+    codes, symbols = factorize(np.r_[np.asarray(bars[symbol_column], dtype = object),
+                                     np.asarray(orders[symbol_column], dtype = object)])
+    bar_codes, order_codes = codes[:len(bars)], codes[len(bars):]
+    times = bars.index.asi8
+    order = np.lexsort((times, bar_codes))
+    bar_codes, times = bar_codes[order], times[order]
+    O, H, L = [np.asarray(bars[c], dtype = np.float64)[order] for c in ("O", "H", "L")]
+    first = np.searchsorted(bar_codes, np.arange(len(symbols)), "left")
+    last = np.searchsorted(bar_codes, np.arange(len(symbols)), "right")
+    start, end = first[order_codes], last[order_codes]
+    if start_column is not None:
+        # rank the times so that symbol and time combine into one sorted key
+        live = to_ns_array(orders[start_column])
+        ranks = np.unique(np.r_[times, live], return_inverse = True)[1]
+        size = len(ranks) + 1
+        key = bar_codes * size + ranks[:len(times)]
+        live = order_codes * size + ranks[len(times):]
+        start = np.maximum(start, np.searchsorted(key, live, "right"))
+
+    x = np.array(orders[price_column], dtype = np.float64)
+    is_buy = (orders[order_column] == buy).values
+    target = np.zeros(n, dtype = bool)
+    if _LEG in orders.columns:
+        target = (orders[_LEG] == "TARGET").values
+    # sell stops and buy limits trigger on the Low
+    down = is_buy == target
+    hit = np.full(n, -1, dtype = np.int64)
+    trail = np.full(n, np.nan)
+    if _TRAIL in orders.columns:
+        trail = np.asarray(orders[_TRAIL], dtype = np.float64)
+    fixed = np.isnan(trail)
+    for side, values in ((True, L), (False, -H)):
+        mask = np.flatnonzero(fixed & (down == side))
+        if len(mask):
+            levels = _Levels(values)
+            sign = 1.0 if side else -1.0
+            hit[mask] = levels.first(start[mask], end[mask], sign * x[mask], strict = OPEN)
+        mask = np.flatnonzero(~fixed & (down == side))
+        if len(mask):
+            hit[mask], x[mask] = _trailing(L, H, start[mask], end[mask], x[mask],
+                                           trail[mask], side, strict = OPEN)
+
+    status = np.where(hit >= 0, "filled", "open").astype(object)
+    if _OCO in orders.columns:
+        # the leg that triggers first wins; stops win ties
+        rank = np.where(hit >= 0, hit * 2 + target, np.iinfo(np.int64).max)
+        group = factorize(orders[_OCO].values)[0]
+        best = np.full(group.max() + 1 if n else 0, np.iinfo(np.int64).max,
+                       dtype = np.int64)
+        np.minimum.at(best, group, rank)
+        won = (rank == best[group]) & (hit >= 0)
+        lost = ~won & (best[group] < np.iinfo(np.int64).max)
+        status[lost] = "cancelled"
+        hit[lost] = -1
+    filled = hit >= 0
+    j = np.maximum(hit, 0)
+    fill = np.where(down, np.minimum(x, O[j]), np.maximum(x, O[j]))
+    TS = np.where(filled, times[j], NaT.value).view("datetime64[ns]")
+    return DataFrame({"TS": TS, "Fill": np.where(filled, fill, np.nan), "Status": status},
+                     index = orders.index, columns = ["TS", "Fill", "Status"])
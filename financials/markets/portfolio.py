@@ -1,11 +1,13 @@
 from collections import Iterable
 import numpy as np
-from pandas import DataFrame, concat
+from pandas import DataFrame, Timestamp, period_range
 from pandas.io.parsers import read_csv
 from pandas.tseries.offsets import DateOffset
 from financials.accounting.cash import Cash
 from financials.tools.AdvancedGroup import AdvancedGroup
 from financials.markets.metrics import Metrics
+from financials.markets.validation import validate, REASONS, Validator, _group_cumsum
+from financials.utilities.store import ColumnStore, Interner, to_ns, to_ns_array
 from functools import partial
 import datetime
 
@@ -44,6 +46,29 @@ def _set_Q_V(df):
     return df
 
 
+def _period_ends(start, end, freq):
+    """
+    Dates marking the end of each period between start and end
+    start, end
+        timestamps as nanoseconds
+    freq
+        pandas frequency string
+    """
+    periods = period_range(Timestamp(start), Timestamp(end), freq = freq)
+    return periods.to_timestamp(how = "end").normalize()
+
+def _end_of_day(dates):
+    """
+    Last nanosecond of each of the given dates
+    """
+    return dates.normalize().asi8 + np.int64(86400 * 10**9 - 1)
+
+
+# Per symbol aggregates maintained by the portfolio
+# Q - net quantity, V - net cash value of trades (negative for purchases)
+# BQ, BV - bought quantity and value, SQ, SV - sold quantity and value
+_POSITION_COLUMNS = ['Q', 'V', 'BQ', 'BV', 'SQ', 'SV']
+
 def _validate_trades(trades, capital, mode_keys = ("B", "S"), limit = 0,
                     allow_short = False, max_weight = 1.0):
 
@@ -61,39 +86,16 @@ def _validate_trades(trades, capital, mode_keys = ("B", "S"), limit = 0,
         maximum weight for a symbol
 
     returns a dict with passed trades and failed trades
-
-    #TO DO: Error code for messages
+    along with the reason for failure
     """
-    from collections import Counter
-    initial_capital = capital + 0.0 #convert to float
-    B,S = mode_keys
-    passed = []
-    failed = []
-    q_counter = Counter()
-    v_counter = Counter()
-    for trade in trades:
-        V = trade["Q"] * trade["P"]
-        if trade["M"] == B:
-            if V < capital:
-                if (v_counter[trade["S"]] + V)/initial_capital < max_weight:
-                    q_counter[trade["S"]] = trade["Q"]
-                    v_counter[trade["S"]] = V
-                    capital -= V
-                    passed.append(trade)
-                else:
-                    failed.append((trade, "Max_weight exceeded"))
-            else:
-                failed.append((trade, "Lack of capital"))
-        elif trade["M"] == S:
-            if q_counter[trade["S"]] >= trade["Q"]:
-                q_counter[trade["S"]] = -trade["Q"]
-                v_counter[trade["S"]] = -V
-                capital += V
-            else:
-                failed.append((trade, "Stock not in holdings"))
-        else:
-            failed.append((trade, "Mode different"))
-    return {"passed": passed, "failed": failed}
+    if len(trades) == 0:
+        return {"passed": [], "failed": []}
+    cols = [[t[k] for t in trades] for k in ("S", "Q", "P", "M")]
+    passed, reasons = validate(*cols, capital = capital, limit = limit,
+                               allow_short = allow_short, max_weight = max_weight,
+                               mode_keys = mode_keys)
+    return {"passed": [t for (t, p) in zip(trades, passed) if p],
+            "failed": [(t, REASONS[r]) for (t, r) in zip(trades, reasons) if r]}
 
 
 class Portfolio(object):
@@ -117,7 +119,14 @@ class Portfolio(object):
             If True, negative positions are included
         """
         self._cash = Cash(capital, TS = TS)
-        self._trades = []
+        self._symbols = Interner()
+        self._modes = Interner()
+        self._trades = ColumnStore([('TS', np.int64), ('S', np.int64),
+                                    ('Q', np.float64), ('P', np.float64),
+                                    ('M', np.int64)])
+        # Running aggregates with one row per symbol code
+        self._positions = ColumnStore([(c, np.float64) for c in _POSITION_COLUMNS],
+                                      capacity = 64)
         self._default_columns = ['TS', 'S', 'Q', 'P', 'M', 'V']
         self._buy = buy
         self._sell = sell
@@ -125,9 +134,8 @@ class Portfolio(object):
         self.metrics = Metrics(self)
 
     def __repr__(self):
-        df = DataFrame(self._trades).set_index("TS")
         return "Balance: {B}, Transactions: {T}".format \
-                (B = self.cash_balance, T = len(df))
+                (B = self.cash_balance, T = len(self._trades))
 
     def __add__(self, pf):
         """
@@ -148,15 +156,37 @@ class Portfolio(object):
             If True, replace the existing trades with validated trades
             Use this option with caution since it reconstructs the entire
             portfolio
+        returns the cash entries after which the balance falls below
+        the limit
         """
-        return self.cash_ledger()[self.cash_ledger().balance < self._limit]
+        return self._cash.below(self._limit)
 
     def validate_positions(self):
         """
         Validates for positions
+        returns the trades after which the position in the symbol
+        is short
         """
-        trades = self.trades.groupby("S")["Q"].cumsum()
-        return self.trades[trades < 0]   #TO DO: A better algorithm
+        store = self._trades
+        short = _group_cumsum(store["S"], store["Q"]) < 0
+        return self._frame(mask = short).set_index("TS")
+
+    def validator(self, allow_short = False, max_weight = None):
+        """
+        Streaming validator for new orders, starting from the present
+        cash balance and holdings of the portfolio
+        allow_short
+            True to allow short sales
+        max_weight
+            maximum value of a symbol as a fraction of the cash balance
+        """
+        store = self._positions
+        symbols = self._symbols.values()[:len(store)]
+        return Validator(self.cash_balance, limit = self._limit,
+                         allow_short = allow_short, max_weight = max_weight,
+                         mode_keys = (self._buy, self._sell),
+                         holdings = dict(zip(symbols, store["Q"])),
+                         values = dict(zip(symbols, -store["V"])))
 
     def add_funds(self, A, TS = None, I = "Capital", **kwargs):
         """
@@ -225,17 +255,68 @@ class Portfolio(object):
         separate column of information. To get best reports, try to be
         consistent with keywords and value
 
+        Returns nothing; the trades are available from the trades property
         """
+        code = self._symbols.code(S)
         dct = kwargs.copy()
-        dct.update([('S', S), ('Q', Q if M == self._buy else -Q), ('P', P),
-                    ('M', M), ('TS', TS)])
-        self._trades.append(dct)
+        dct.update([('S', code), ('Q', Q if M == self._buy else -Q), ('P', P),
+                    ('M', self._modes.code(M)), ('TS', to_ns(TS))])
+        self._trades.append(**dct)
+        self._update_positions(code, Q, P, M == self._buy)
         if M == self._buy:
             self.withdraw_funds(P * Q, TS = TS, I = I)
         else:
             self.add_funds(P * Q, TS = TS, I = I)
-        return self._trades
 
+    def add_trades_bulk(self, S, Q = None, P = None, M = None, I = "Trade",
+                        TS = None, **kwargs):
+        """
+        Add a batch of trades in a single pass
+
+        Parameters
+        ----------
+        S: Symbols. list/array or a DataFrame
+            If a DataFrame is given, the columns S, Q, P, M and optionally
+            TS are used for the trades and all other columns are
+            stored as additional information
+        Q: Quantities. list/array
+        P: Prices. list/array
+        M: Modes. list/array
+        TS: timestamps. list/array or a single timestamp
+            By default, the present time is taken
+
+        **kwargs
+        --------
+        Arrays of additional information; each keyword is stored as a
+        separate column
+
+        Cash ledger entries and position aggregates are updated for
+        the whole batch at once
+        Returns nothing; the trades are available from the trades property
+        """
+        if isinstance(S, DataFrame):
+            df = S
+            S, Q, P, M = df.S.values, df.Q.values, df.P.values, df.M.values
+            if "TS" in df.columns:
+                TS = df.TS.values
+            for c in df.columns:
+                if c not in ("S", "Q", "P", "M", "TS"):
+                    kwargs[c] = df[c].values
+        S = np.asarray(S, dtype = object)
+        if len(S) == 0:
+            return
+        Q = np.asarray(Q, dtype = np.float64)
+        P = np.asarray(P, dtype = np.float64)
+        M = np.asarray(M, dtype = object)
+        is_buy = M == self._buy
+        codes = self._symbols.codes(S)
+        timestamps = to_ns_array(TS, len(S))
+        dct = dict(kwargs)
+        dct.update([('S', codes), ('Q', np.where(is_buy, Q, -Q)), ('P', P),
+                    ('M', self._modes.codes(M)), ('TS', timestamps)])
+        self._trades.extend(**dct)
+        self._update_positions(codes, Q, P, is_buy)
+        self._cash.extend(np.where(is_buy, -P * Q, P * Q), timestamps, I = I)
 
     def add_trades_from_file(self, filename, mappings = None, **options):
         """
@@ -253,12 +334,11 @@ class Portfolio(object):
         df = read_csv(filename, **options)
         if mappings is not None:
             df.columns = _map_columns(df.columns, mappings)
-        self._trades = concat([self._trades, df])
-        self._set_Q_V()
-        return self._trades['TS', 'S', 'Q', 'P', 'M']
+        self.add_trades_bulk(df)
+        return self.trades
 
 
-    def weights(self, method = "transaction", S = None, **kwargs):
+    def weights(self, method = "transaction", S = None, price = None, **kwargs):
         """
         Get the current weights of the all the stocks in portfolio
         By default, weights for all the stocks are returned
@@ -271,49 +351,170 @@ class Portfolio(object):
 
         S: Symbol. string or list.
             Symbol or list of symbols for which weight is required
+        price
+            current price of the stocks as series
+            Required for the valuation method
 
         """
-        df = self.summary[self.summary.Q != 0]
-        return n(df.V)
+        if method == "valuation":
+            if price is None:
+                raise ValueError("price is required for the valuation method")
+            df = self.valuation(price)
+        else:
+            df = self.summary
+        df = df[df.Q != 0]
+        w = n(df.V)
+        return w if S is None else w.reindex(S if isinstance(S, list) else [S])
 
-    def weight_history(self, S, freq = "M"):
+    def weight_history(self, S = None, freq = "M", method = "transaction",
+                       price = None):
         """
         Get the weight history for a symbol
         S
-            Symbol
+            Symbol or list of symbols
+            If None, the history of all symbols is returned
         freq
             frequency to calculate history
-        """
-        pass
+        method
+            'transaction' - based on BUY and SELL
+            'valuation' - based on the price at the end of each period
+        price
+            dataframe of prices with datetime index and symbols as columns
+            Required for the valuation method
+
+        Weights are calculated from the positions at the end of each
+        period, which are checkpointed in a single pass over the trades
+        """
+        if len(self._trades) == 0:
+            return DataFrame()
+        TS = self._trades["TS"]
+        dates = _period_ends(TS.min(), TS.max(), freq)
+        Q, V = self._snapshot(_end_of_day(dates))
+        symbols = self._symbols.values()
+        if method == "valuation":
+            if price is None:
+                raise ValueError("price is required for the valuation method")
+            P = price.reindex(columns = symbols).reindex(dates, method = "ffill")
+            V = Q * P.values
+        V = np.where(Q != 0, V, np.nan)
+        df = DataFrame(V, index = dates, columns = symbols)
+        df = df.div(df.sum(axis = 1), axis = 0).sort_index(axis = 1)
+        if S is None:
+            return df
+        return df[S]
+
+    def _snapshot(self, cutoff):
+        """
+        Net quantity and value of each symbol at the given times
+        cutoff
+            sorted array of times as nanoseconds
+        returns two arrays with a row for each cutoff and a column
+        for each symbol code
+
+        Trades are binned into the periods between cutoffs and the
+        bins are accumulated, so the trades are read only once
+        """
+        store = self._trades
+        size = len(self._symbols)
+        rows = len(cutoff) + 1
+        if size == 0:
+            return np.zeros((len(cutoff), 0)), np.zeros((len(cutoff), 0))
+        bins = np.searchsorted(cutoff, store["TS"], "left") * size + store["S"]
+        total = lambda w: np.bincount(bins, weights = w, minlength = rows * size) \
+                          .reshape(rows, size).cumsum(axis = 0)[:-1]
+        return total(store["Q"]), total(-store["Q"] * store["P"])
+
+    def _update_positions(self, code, Q, P, is_buy):
+        """
+        Update the running aggregates with a single trade
+        or with arrays of trades
+        """
+        missing = len(self._symbols) - len(self._positions)
+        if missing > 0:
+            self._positions.extend(**{c: np.zeros(missing) for c in _POSITION_COLUMNS})
+        V = P * Q
+        if np.ndim(code) > 0:
+            size = len(self._symbols)
+            total = lambda w, mask: np.bincount(code, weights = np.where(mask, w, 0.0),
+                                                minlength = size)
+            BQ, BV = total(Q, is_buy), total(V, is_buy)
+            SQ, SV = total(Q, ~is_buy), total(V, ~is_buy)
+            self._positions.add_at(np.arange(size), Q = BQ - SQ, V = SV - BV,
+                                   BQ = BQ, BV = BV, SQ = SQ, SV = SV)
+        elif is_buy:
+            self._positions.add_at(code, Q = Q, V = -V, BQ = Q, BV = V)
+        else:
+            self._positions.add_at(code, Q = -Q, V = V, SQ = Q, SV = V)
+
+    @property
+    def positions(self):
+        """
+        Running aggregates by symbol
+        Q - net quantity
+        V - net value of trades; negative for purchases
+        BQ, BV - quantity and value bought
+        SQ, SV - quantity and value sold
+        """
+        store = self._positions
+        df = DataFrame({c: store[c] for c in _POSITION_COLUMNS},
+                       index = self._symbols.values()[:len(store)],
+                       columns = _POSITION_COLUMNS)
+        df.index.name = "S"
+        return df.sort_index()
+
+    def _frame(self, columns = None, mask = None):
+        """
+        Build a dataframe of trades from the columnar store
+        Symbols and modes are decoded from their integer codes
+        columns
+            columns to include; all columns by default
+        mask
+            boolean array or indices to select trades
+        """
+        store = self._trades
+        columns = store.fields if columns is None else columns
+        data = {}
+        for c in columns:
+            arr = store[c] if mask is None else store[c][mask]
+            if c == "S":
+                data[c] = self._symbols.values(arr)
+            elif c == "M":
+                data[c] = self._modes.values(arr)
+            elif c == "TS":
+                data[c] = arr.view("datetime64[ns]")
+            else:
+                data[c] = arr
+        return DataFrame(data, columns = columns)
 
     @property
     def trades(self):
         """
         Gets the list of trades
         """
-        return DataFrame(self._trades).set_index("TS")
+        return self._frame().set_index("TS")
 
     @property
     def summary(self):
         """
         Provides a summary of the portfolio by symbols
         """
-        df = DataFrame(self._trades)
-        df["V"] = df.P * -df.Q
-        return df.groupby("S").agg({"Q": sum, "V": sum})
+        return self.positions[["Q", "V"]]
 
     def clear_trades(self):
         """
         Clear all trades
         """
-        self._trades = []
+        self._trades.clear()
+        self._positions.clear()
+        self._symbols = Interner()
+        self._modes = Interner()
 
     @property
     def holdings(self):
         """
         Gets the list of positions
         """
-        return DataFrame(self._trades).groupby(['S']).agg({'Q': np.sum})
+        return self.positions[["Q"]]
 
     def valuation(self, price):
         """
@@ -321,8 +522,8 @@ class Portfolio(object):
         price
             current price of the stocks as series
         """
-        df = DataFrame(self._trades).groupby("S").agg({"Q": sum})
-        df["P"] = price.ix[df.index]
+        df = self.holdings
+        df["P"] = price.reindex(df.index)
         df["V"] = df.Q * df.P
         return df
 
@@ -330,10 +531,11 @@ class Portfolio(object):
         """
         Average price of the shares
         """
-        df = DataFrame(self._trades)
-        df["V"] = df.Q * df.P + 0.0
-        df2 = df.groupby(["S", "M"]).agg({"Q": sum, "V": sum}).unstack()
-        return df2.V/df2.Q
+        df = self.positions
+        df = DataFrame({self._buy: df.BV / df.BQ, self._sell: df.SV / df.SQ},
+                       columns = [self._buy, self._sell])
+        df.columns.name = "M"
+        return df
 
     def infer(self, what, FROM, relation, function):
         """
@@ -347,5 +549,4 @@ class Portfolio(object):
         f
             Any valid pandas dataframe query
         """
-        df = DataFrame(self._trades)
-        return df.query(f)
+        return self._frame().query(f)
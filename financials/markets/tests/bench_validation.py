@@ -0,0 +1,33 @@
+"""
+Benchmark of batch validation against checking orders one by one
+
+Run as a script; not collected as a test since timings depend on
+the machine
+    PYTHONPATH=. python financials/markets/tests/bench_validation.py
+"""
+
+import time
+import numpy as np
+from financials.markets.validation import validate, Validator
+
+def run(n = 500000, symbols = 2000, seed = 0):
+    np.random.seed(seed)
+    S = np.array(["s%d" % i for i in np.random.randint(0, symbols, n)], dtype = object)
+    Q = np.random.randint(1, 100, n).astype(float)
+    P = np.random.rand(n) * 100
+    for buys, kw in [(0.7, dict(capital = 1e9)), (0.6, dict(capital = 1e6)),
+                     (0.55, dict(capital = 1e6, max_weight = 0.05))]:
+        M = np.where(np.random.rand(n) < buys, "B", "S").astype(object)
+        t = time.time()
+        reasons = validate(S, Q, P, M, **kw)[1]
+        batch = time.time() - t
+        v = Validator(**kw)
+        t = time.time()
+        expected = [v.check(*order)[1] for order in zip(S, Q, P, M)]
+        loop = time.time() - t
+        print("{K}: {F} failures, batch {B:.2f}s, one by one {L:.2f}s, same {E}".format(
+              K = kw, F = (reasons != 0).sum(), B = batch, L = loop,
+              E = list(reasons) == expected))
+
+if __name__ == "__main__":
+    run()
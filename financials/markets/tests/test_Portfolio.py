@@ -1,7 +1,7 @@
 import unittest
 import datetime
 
-from financials.markets.Portfolio import Portfolio
+from financials.markets.portfolio import Portfolio
 from pandas.io.parsers import read_csv
 
 class TestPortfolio(unittest.TestCase):
@@ -21,3 +21,87 @@ class TestPortfolio(unittest.TestCase):
         self.pf.add_funds(2000, TS = '2014-01-02')
         self.pf.withdraw_funds(5500, TS = '2014-01-03')
         self.assertEqual(self.pf.cash_balance,0)
+
+    def test_trades(self):
+        # trades are stored in columns and decoded on access
+        pf = Portfolio(capital = 1000)
+        pf.add_trades("A", 10, 20, "BUY", TS = "2014-01-01")
+        pf.add_trades("B", 5, 30, "BUY", TS = "2014-01-02", note = "x")
+        pf.add_trades("A", 4, 25, "SELL", TS = "2014-01-03")
+        df = pf.trades
+        self.assertEqual(list(df.S), ["A", "B", "A"])
+        self.assertEqual(list(df.Q), [10, 5, -4])
+        self.assertEqual(list(df.M), ["BUY", "BUY", "SELL"])
+        self.assertEqual(list(df.note), [None, "x", None])
+        self.assertEqual(df.index[-1], datetime.datetime(2014, 1, 3))
+        self.assertEqual(pf.holdings.Q.to_dict(), {"A": 6, "B": 5})
+        pf.clear_trades()
+        self.assertEqual(len(pf.trades), 0)
+
+    def test_positions(self):
+        # running aggregates must match a groupby over all trades
+        import numpy as np
+        from pandas.util.testing import assert_frame_equal, assert_series_equal
+        np.random.seed(1)
+        pf = Portfolio(capital = 100000)
+        for i in range(200):
+            pf.add_trades(np.random.choice(list("ABCDE")), np.random.randint(1, 100),
+                          np.random.randint(10, 50), np.random.choice(["BUY", "SELL"]))
+        df = pf._frame()
+        df["S"] = df.S.astype(str)
+        df["V"] = df.P * -df.Q
+        expected = df.groupby("S").agg({"Q": sum, "V": sum})[["Q", "V"]]
+        assert_frame_equal(pf.summary, expected, check_names = False)
+        assert_frame_equal(pf.holdings, expected[["Q"]], check_names = False)
+        weights = expected[expected.Q != 0].V
+        assert_series_equal(pf.weights(), weights/weights.sum(), check_names = False)
+        df["V"] = df.Q * df.P
+        price = df.groupby(["S", "M"]).agg({"Q": sum, "V": sum}).unstack()
+        assert_frame_equal(pf.price(), price.V/price.Q, check_names = False)
+
+    def test_add_trades_bulk(self):
+        # bulk ingestion must match booking trades one at a time
+        from pandas import DataFrame
+        from pandas.util.testing import assert_frame_equal
+        df = DataFrame({"S": ["A", "B", "A", "C"], "Q": [10, 5, 4, 8],
+                        "P": [20, 30, 25, 10], "M": ["BUY", "BUY", "SELL", "SELL"],
+                        "TS": ["2014-01-01", "2014-01-02", "2014-01-03", "2014-01-04"]})
+        one, bulk = Portfolio(capital = 1000), Portfolio(capital = 1000)
+        for s, q, p, m, ts in df[["S", "Q", "P", "M", "TS"]].values:
+            one.add_trades(s, q, p, m, TS = ts)
+        bulk.add_trades_bulk(df)
+        assert_frame_equal(one.trades, bulk.trades)
+        assert_frame_equal(one.summary, bulk.summary)
+        self.assertEqual(one.cash_balance, bulk.cash_balance)
+        self.assertEqual(bulk.cash_balance, 1000 - 200 - 150 + 100 + 80)
+
+    def test_weight_history(self):
+        from pandas import DataFrame, date_range
+        pf = Portfolio(capital = 10000)
+        pf.add_trades("A", 10, 10, "BUY", TS = "2014-01-05")
+        pf.add_trades("B", 10, 30, "BUY", TS = "2014-01-31 15:00")
+        pf.add_trades("A", 10, 20, "BUY", TS = "2014-02-10")
+        pf.add_trades("B", 10, 40, "SELL", TS = "2014-03-01")
+        df = pf.weight_history()
+        self.assertEqual(list(df.A), [0.25, 0.5, 1.0])
+        self.assertEqual(list(df.B.fillna(0)), [0.75, 0.5, 0])
+        self.assertEqual(list(pf.weight_history("A", freq = "A")), [1.0])
+        price = DataFrame({"A": [10, 20, 30], "B": [10, 20, 30]},
+                          index = date_range("2014-01-31", periods = 3, freq = "M"))
+        df = pf.weight_history(method = "valuation", price = price)
+        self.assertEqual(list(df.A), [0.5, 2.0/3, 1.0])
+        self.assertEqual(pf.weights(S = "A").A, 1.0)
+
+    def test_validate(self):
+        # checks on the stored trades and on a stream of new orders
+        pf = Portfolio(capital = 100, TS = "2014-01-01")
+        pf.add_trades("A", 10, 5, "BUY", TS = "2014-01-01")
+        pf.add_trades("A", 15, 5, "SELL", TS = "2014-01-02")
+        pf.add_trades("B", 10, 20, "BUY", TS = "2014-01-03")
+        self.assertEqual(list(pf.validate_positions().S), ["A"])
+        self.assertEqual(list(pf.validate_trades().balance), [-75])
+        v = pf.validator()
+        self.assertEqual(v.capital, -75)
+        self.assertEqual(v.check("A", 5, 5, "BUY"), (False, 1))
+        self.assertEqual(v.check("B", 5, 20, "SELL"), (True, 0))
+        self.assertEqual(v.holdings.to_dict(), {"A": -5, "B": 5})
@@ -0,0 +1,174 @@
+import unittest
+import numpy as np
+from pandas import Series
+from financials.markets.portfolio import Portfolio
+
+class TestMetrics(unittest.TestCase):
+
+    def setUp(self):
+        self.pf = Portfolio(capital = 10000)
+        self.pf.add_trades("A", 10, 100, "BUY", TS = "2014-01-01")
+        self.pf.add_trades("B", 20, 50, "BUY", TS = "2014-01-01")
+        self.pf.add_trades("A", 4, 110, "SELL", TS = "2014-01-02")
+        self.price = Series({"A": 105.0, "B": 45.0})
+
+    def test_stream(self):
+        mtm = self.pf.metrics.stream(self.price)
+        self.assertAlmostEqual(mtm.mtm, self.pf.metrics.mtm(self.price))
+        self.assertAlmostEqual(mtm.unrealized, 6 * 5 - 20 * 5)
+        self.assertAlmostEqual(mtm.exposure, 6 * 105 + 20 * 45)
+        mtm.tick("B", 55.0)
+        self.price["B"] = 55.0
+        self.assertAlmostEqual(mtm.mtm, self.pf.metrics.mtm(self.price))
+        self.assertAlmostEqual(mtm.symbol_unrealized["B"], 100)
+        # new trades are picked up on the next tick
+        self.pf.add_trades("C", 5, 10, "BUY")
+        mtm.tick("C", 12.0)
+        self.price["C"] = 12.0
+        self.assertAlmostEqual(mtm.mtm, self.pf.metrics.mtm(self.price))
+        self.assertAlmostEqual(mtm.unrealized, 6 * 5 + 20 * 5 + 5 * 2)
+
+    def test_stream_reopen(self):
+        # the basis is the cost of the lots still open
+        pf = Portfolio(capital = 10000)
+        pf.add_trades("A", 10, 100, "BUY")
+        pf.add_trades("A", 10, 120, "SELL")
+        pf.add_trades("A", 10, 150, "BUY")
+        price = Series({"A": 150.0})
+        for method in ("fifo", "lifo", "average"):
+            mtm = pf.metrics.stream(price, method = method)
+            self.assertAlmostEqual(mtm.unrealized, 0)
+            self.assertAlmostEqual(mtm.unrealized,
+                                   pf.metrics.unrealized_profit(price, method = method))
+        mtm.tick("A", 160.0)
+        self.assertAlmostEqual(mtm.symbol_unrealized["A"], 100)
+        pf.add_trades("A", 15, 170, "SELL")
+        self.assertAlmostEqual(mtm.symbol_unrealized["A"], 5 * (170 - 160))
+
+    def test_stream_incremental(self):
+        # ticks and new trades adjust the totals; they must agree with
+        # a stream loaded afresh and with the cost of the open lots
+        np.random.seed(9)
+        pf = Portfolio(capital = 10**6)
+        symbols = np.array(["s%d" % i for i in range(50)], dtype = object)
+        for method in ("fifo", "lifo", "average"):
+            mtm = pf.metrics.stream(method = method)
+            for i in range(20):
+                S = symbols[np.random.randint(0, 50, 30)]
+                M = np.where(np.random.rand(30) < 0.6, "BUY", "SELL")
+                pf.add_trades_bulk(S, np.random.randint(1, 20, 30),
+                                   np.random.rand(30) * 100, M)
+                mtm.ticks(symbols[:40], np.random.rand(40) * 100)
+                mtm.tick(symbols[45], 50.0)
+                fresh = pf.metrics.stream(mtm.prices, method = method)
+                self.assertAlmostEqual(mtm.mtm, fresh.mtm)
+                self.assertAlmostEqual(mtm.unrealized, fresh.unrealized)
+                self.assertAlmostEqual(mtm.exposure, fresh.exposure)
+            book = pf.metrics._book(method)
+            if method != "average":
+                lots = np.zeros(len(book.position))
+                for code in range(len(lots)):
+                    lot = book._head[code]
+                    while lot >= 0:
+                        lots[code] += book._lot_q[lot] * book._lot_p[lot]
+                        lot = book._next[lot]
+                self.assertTrue(np.allclose(book.cost(), np.sign(book.position) * lots))
+
+    def test_realized_profit(self):
+        pf = Portfolio(capital = 10000)
+        for s, q, p, m in [("A", 10, 1, "BUY"), ("A", 10, 2, "BUY"), ("A", 15, 3, "SELL"),
+                           ("A", 10, 4, "SELL"), ("A", 5, 1, "BUY")]:
+            pf.add_trades(s, q, p, m)
+        expected = {"fifo": 50, "lifo": 50, "average": 50}
+        for method, value in expected.items():
+            self.assertAlmostEqual(pf.metrics.realized_profit(method = method), value)
+            self.assertAlmostEqual(pf.metrics.realized_profit(method = method, batch = True), value)
+        # partial close
+        pf.add_trades("B", 10, 10, "BUY")
+        pf.add_trades("B", 10, 20, "BUY")
+        pf.add_trades("B", 5, 30, "SELL")
+        by_symbol = pf.metrics.realized_profit(method = "fifo", by_symbol = True)
+        self.assertEqual(by_symbol["B"], 100)
+        self.assertEqual(pf.metrics.realized_profit(method = "lifo", by_symbol = True)["B"], 50)
+        self.assertEqual(pf.metrics.realized_profit(method = "average", by_symbol = True)["B"], 75)
+
+    def test_realize_average(self):
+        # the vectorized average cost must match the incremental lot book
+        from financials.markets.lots import LotBook, realize_average
+        np.random.seed(8)
+        codes = np.random.randint(0, 5, 2000)
+        Q = np.random.randint(-20, 21, 2000).astype(float)
+        P = np.random.rand(2000) * 100
+        book = LotBook("average")
+        expected = np.array([book.add(c, q, p) for (c, q, p) in zip(codes, Q, P)])
+        self.assertTrue(np.allclose(realize_average(codes, Q, P)[0], expected))
+        # in two batches, the second starting from the open positions
+        batched = LotBook("average")
+        first = batched.add_many(codes[:700], Q[:700], P[:700])
+        second = batched.add_many(codes[700:], Q[700:], P[700:])
+        self.assertTrue(np.allclose(np.r_[first, second], expected))
+        self.assertTrue(np.allclose(batched.cost(), book.cost()))
+        self.assertEqual(Portfolio(100).metrics.realized_profit(batch = True), 0)
+
+    def test_realize_fifo(self):
+        # the vectorized fifo must match the incremental lot book
+        from financials.markets.lots import LotBook, realize_fifo
+        np.random.seed(7)
+        codes = np.random.randint(0, 5, 1000)
+        Q = np.random.randint(-20, 21, 1000).astype(float)
+        P = np.random.rand(1000) * 100
+        expected = LotBook("fifo").add_many(codes, Q, P)
+        self.assertTrue(np.allclose(realize_fifo(codes, Q, P), expected))
+
+    def test_realize_lifo(self):
+        # the vectorized lifo must match the incremental lot book
+        from financials.markets.lots import LotBook, realize_lifo
+        np.random.seed(7)
+        codes = np.random.randint(0, 5, 1000)
+        Q = np.random.randint(-20, 21, 1000).astype(float)
+        P = np.random.rand(1000) * 100
+        expected = LotBook("lifo").add_many(codes, Q, P)
+        self.assertTrue(np.allclose(realize_lifo(codes, Q, P), expected))
+        # a position built up with small sales and closed at once
+        Q = np.where(np.arange(1000) % 2 == 0, 3.0, -1.0)
+        Q[-1] = -Q[:-1].sum()
+        expected = LotBook("lifo").add_many(codes * 0, Q, P)
+        self.assertTrue(np.allclose(realize_lifo(codes * 0, Q, P), expected))
+
+    def test_equity(self):
+        from pandas import DataFrame, date_range
+        pf = Portfolio(1000, TS = "2014-01-01")
+        pf.add_trades("A", 10, 10, "BUY", TS = "2014-01-02 10:00")
+        pf.add_funds(500, TS = "2014-01-03 09:00")
+        pf.add_trades("A", 5, 12, "SELL", TS = "2014-01-04 10:00")
+        price = DataFrame({"A": [10, 11, 12, 11, 13]}, index = date_range("2014-01-01", periods = 5))
+        m = pf.metrics
+        self.assertEqual(list(m.equity(price)), [1000, 1010, 1520, 1515, 1525])
+        self.assertAlmostEqual(m.returns().iloc[1], 10.0 / 1010) # net of the capital added
+        self.assertAlmostEqual(m.profit(), 25)
+        self.assertAlmostEqual(m.ROC(), 25.0 / 1500)
+        self.assertAlmostEqual(m.max_drawdown(), 1515.0 / 1520 - 1)
+        self.assertAlmostEqual(m.sharpe(), m.mean() / m.std())
+        curve = m._curve()
+        self.assertTrue(m._curve() is curve) # cached
+        pf.add_trades("A", 5, 13, "SELL", TS = "2014-01-05 10:00")
+        self.assertFalse(m._curve() is curve)
+        self.assertEqual(m.equity().iloc[-1], 1525)
+
+    def test_equity_cash_only(self):
+        from pandas import DataFrame, date_range
+        pf = Portfolio(1000, TS = "2014-01-01")
+        price = DataFrame({"A": [10, 11]}, index = date_range("2014-01-01", periods = 2))
+        self.assertEqual(list(pf.metrics.equity(price)), [1000, 1000])
+        self.assertEqual(pf.metrics.returns().iloc[0], 0)
+
+    def test_equity_intraday(self):
+        # a bar sees only what happened before the next bar starts
+        from pandas import DataFrame, date_range
+        pf = Portfolio(1000, TS = "2014-01-01")
+        pf.add_trades("A", 10, 10, "BUY", TS = "2014-01-02 15:00")
+        price = DataFrame({"A": 10.0}, index = date_range("2014-01-02 09:00", periods = 8, freq = "H"))
+        equity = pf.metrics.equity(price, freq = "H")
+        cash = pf.metrics._curve().cash
+        self.assertEqual(list(cash), [1000] * 6 + [900] * 2)
+        self.assertEqual(list(equity), [1000] * 8)
@@ -0,0 +1,43 @@
+import unittest
+import numpy as np
+from pandas import DataFrame, DatetimeIndex, date_range
+
+from financials.markets.universe import Universe
+from financials.utilities.utilities import IndexMembership
+
+class TestUniverse(unittest.TestCase):
+
+    universe = Universe(["A", "B", "A", "C"],
+                        ["2014-01-01", "2014-01-01", "2014-01-10", "2014-01-05"],
+                        ["2014-01-03", None, "2014-01-20", "2014-01-06"])
+
+    def test_eligible(self):
+        u = self.universe
+        self.assertEqual(list(u.eligible("2014-01-02")), ["A", "B"])
+        self.assertEqual(list(u.eligible("2014-01-03")), ["B"])
+        self.assertEqual(list(u.eligible("2014-01-05")), ["B", "C"])
+        self.assertEqual(list(u.eligible("2014-01-15")), ["A", "B"])
+        self.assertEqual(len(u.intervals("A")), 2)
+        self.assertEqual(u.intervals("B")[0][1], None)
+        self.assertEqual(u.intervals("X"), [])
+
+    def test_flag(self):
+        # the join must agree with looking up each row on its own
+        np.random.seed(2)
+        dates = date_range("2013-12-30", "2014-01-25")
+        panel = DataFrame({"S": np.random.choice(list("ABCD"), 200),
+                           "P": np.random.rand(200)},
+                          index = np.random.choice(dates, 200))
+        flagged = self.universe.flag(panel)
+        expected = [s in self.universe.eligible(d) for (d, s) in zip(panel.index, panel.S)]
+        self.assertEqual(list(flagged.in_universe), expected)
+        matrix = self.universe.matrix(dates)
+        self.assertEqual(list(matrix.loc["2014-01-05"]), [False, True, True])
+
+    def test_from_membership(self):
+        IM = IndexMembership("2014-01-01", "2014-01-03", ["A", "B"],
+                             include = DataFrame(["C"], index = DatetimeIndex(["2014-01-02"])),
+                             exclude = DataFrame(["A"], index = DatetimeIndex(["2014-01-02"])))
+        u = Universe.from_membership(IM)
+        dates = date_range("2014-01-01", "2014-01-03")
+        self.assertTrue((u.matrix(dates) == IM.membership_matrix(dates)).all().all())
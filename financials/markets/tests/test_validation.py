@@ -44,4 +44,58 @@ assert_sequence_equal(tr[1:], _validate(trades, capital = 0, allow_short = True)
 assert_sequence_equal(tr, _validate(trades, capital = 200, allow_short = True))
 trades[1].update({'M': 'B'})
 assert_sequence_equal(tr, _validate(trades, capital = 300, allow_short = True))
-assert_sequence_equal([tr[0]] + tr[2:], _validate(trades, capital = 200, allow_short = True))
\ No newline at end of file
+assert_sequence_equal([tr[0]] + tr[2:], _validate(trades, capital = 200, allow_short = True))
+
+# Batch validation with reason codes
+from financials.markets.validation import validate, NO_CAPITAL, NO_STOCK, MAX_WEIGHT, BAD_MODE
+S = ["X", "Y", "X", "Z", "Y", "X"]
+Q = [10, 10, 20, 5, 10, 5]
+P = [10, 20, 10, 10, 20, 10]
+M = ["B", "B", "S", "X", "S", "B"]
+passed, reasons = validate(S, Q, P, M, capital = 300)
+assert_sequence_equal([True, True, False, False, True, True], list(passed))
+assert_sequence_equal([0, 0, NO_STOCK, BAD_MODE, 0, 0], list(reasons))
+passed, reasons = validate(S, Q, P, M, capital = 250, limit = 100)
+assert_sequence_equal([0, NO_CAPITAL, NO_STOCK, BAD_MODE, NO_STOCK, 0], list(reasons))
+passed, reasons = validate(S, Q, P, M, capital = 300, max_weight = 0.6)
+assert_sequence_equal([0, MAX_WEIGHT, NO_STOCK, BAD_MODE, NO_STOCK, 0], list(reasons))
+passed, reasons = validate(S, Q, P, M, capital = 300, holdings = {"X": 20})
+assert_sequence_equal([0, 0, 0, BAD_MODE, 0, 0], list(reasons))
+
+# Streaming validation gives the same results as the batch
+from financials.markets.validation import Validator
+for kw in [dict(capital = 300), dict(capital = 250, limit = 100),
+           dict(capital = 300, max_weight = 0.6), dict(capital = 300, holdings = {"X": 20})]:
+    v = Validator(mode_keys = ("B", "S"), **kw)
+    result = [v.check(*order)[1] for order in zip(S, Q, P, M)]
+    assert_sequence_equal(list(validate(S, Q, P, M, **kw)[1]), result)
+    v = Validator(**kw)
+    first = v.check_batch(S[:3], Q[:3], P[:3], M[:3])[1]
+    second = v.check_batch(S[3:], Q[3:], P[3:], M[3:])[1]
+    assert_sequence_equal(list(validate(S, Q, P, M, **kw)[1]), list(first) + list(second))
+v = Validator(capital = 300)
+v.check("X", 10, 10, "B", commit = False)
+assert v.capital == 300
+v.check("X", 10, 10, "B")
+assert v.capital == 200 and v.holdings["X"] == 10
+
+# A buy reaching max_weight exactly is rejected
+passed, reasons = validate(["X", "X"], [4, 1], [10, 10], ["B", "B"], capital = 100,
+                           max_weight = 0.5)
+assert_sequence_equal([0, MAX_WEIGHT], list(reasons))
+assert Validator(capital = 100, max_weight = 0.5).check("X", 5, 10, "B") == (False, MAX_WEIGHT)
+
+# Many failures at scale; the batch must agree with checking one by one
+import numpy as np
+np.random.seed(11)
+n = 100000
+S = np.array(["s%d" % i for i in np.random.randint(0, 500, n)], dtype = object)
+Q = np.random.randint(1, 100, n).astype(float)
+P = np.random.rand(n) * 100
+M = np.where(np.random.rand(n) < 0.55, "B", "S").astype(object)
+for kw in [dict(capital = 1e5), dict(capital = 1e6, max_weight = 0.05)]:
+    reasons = validate(S, Q, P, M, **kw)[1]
+    v = Validator(**kw)
+    expected = [v.check(*order)[1] for order in zip(S, Q, P, M)]
+    assert (reasons != 0).sum() > n // 10
+    assert_sequence_equal(expected, list(reasons))
@@ -0,0 +1,150 @@
+"""
+Point in time universe of symbols
+
+A symbol is eligible during a list of [start, end) intervals. Intervals
+are kept sorted by symbol and start, so eligibility of any number of
+(symbol, date) pairs is found with a single search
+"""
+
+import numpy as np
+from pandas import DataFrame, DatetimeIndex, Index, Timestamp, factorize
+from financials.utilities.store import to_ns, to_ns_array
+
+_MAX_NS = np.iinfo(np.int64).max
+
+class Universe(object):
+    """
+    Point in time universe of eligible symbols
+    """
+    def __init__(self, S, start, end = None):
+        """
+        S
+            array of symbols
+        start
+            array of dates from which the symbol is eligible
+        end
+            array of dates from which the symbol is no longer eligible
+            Missing values or None for symbols still eligible
+        Intervals of a symbol must not overlap
+        """
+        S = np.asarray(S, dtype = object)
+        start = to_ns_array(start, len(S))
+        if end is None:
+            end = np.full(len(S), _MAX_NS, dtype = np.int64)
+        else:
+            end = to_ns_array(end, len(S))
+            end = np.where(end == Timestamp("NaT").value, _MAX_NS, end)
+        codes, names = factorize(S, sort = True)
+        keep = start < end
+        order = np.lexsort((start[keep], codes[keep]))
+        self.names = np.asarray(names, dtype = object)
+        self.codes = codes[keep][order]
+        self.start = start[keep][order]
+        self.end = end[keep][order]
+
+    @classmethod
+    def from_membership(cls, membership):
+        """
+        Universe of the constituents of an index
+        membership
+            an IndexMembership
+        """
+        universe = cls([], [])
+        universe.names = membership.names
+        order = np.lexsort((membership.start, membership.codes))
+        universe.codes = membership.codes[order]
+        universe.start = membership.start[order]
+        universe.end = membership.end[order]
+        return universe
+
+    @classmethod
+    def from_frame(cls, df, S = "S", start = "start", end = "end"):
+        """
+        Universe from a dataframe with a row for each interval
+        """
+        return cls(df[S].values, df[start].values,
+                   df[end].values if end in df.columns else None)
+
+    def __repr__(self):
+        return "Universe: {N} symbols, {I} intervals".format \
+                (N = len(self.names), I = len(self.codes))
+
+    def __len__(self):
+        return len(self.names)
+
+    def intervals(self, S):
+        """
+        Intervals during which a symbol is eligible
+        returns a list of (start, end) timestamps; end is None
+        if the symbol is still eligible
+        """
+        code = Index(self.names).get_indexer([S])[0]
+        if code < 0:
+            return []
+        lo, hi = np.searchsorted(self.codes, [code, code + 1])
+        return [(Timestamp(s), None if e == _MAX_NS else Timestamp(e))
+                for (s, e) in zip(self.start[lo:hi], self.end[lo:hi])]
+
+    def eligible(self, date):
+        """
+        Symbols eligible on the given date as a sorted array
+        """
+        TS = to_ns(date)
+        live = (self.start <= TS) & (TS < self.end)
+        return self.names[np.unique(self.codes[live])]
+
+    def is_eligible(self, S, TS):
+        """
+        Whether each symbol is eligible at the corresponding time
+        S
+            array of symbols
+        TS
+            array of timestamps or a single timestamp
+        returns a boolean array
+        """
+        S = np.asarray(S, dtype = object)
+        TS = to_ns_array(TS, len(S))
+        if len(self.codes) == 0:
+            return np.zeros(len(S), dtype = bool)
+        code = Index(self.names).get_indexer(S)
+        # rank the times so that symbol and time combine into one sorted key
+        ranks = np.unique(np.r_[self.start, TS], return_inverse = True)[1]
+        size = len(ranks) + 1
+        keys = self.codes * size + ranks[:len(self.start)]
+        at = np.searchsorted(keys, code * size + ranks[len(self.start):], "right") - 1
+        found = (code >= 0) & (at >= 0)
+        at = np.maximum(at, 0)
+        return found & (self.codes[at] == code) & (TS < self.end[at])
+
+    def flag(self, panel, S = "S", TS = None, name = "in_universe"):
+        """
+        Attach a column to a price panel flagging the rows eligible
+        at their time
+        panel
+            dataframe with a row for each symbol and time
+        S
+            column with the symbol
+        TS
+            column with the time; the index by default
+        name
+            name of the column
+        """
+        times = panel.index if TS is None else panel[TS]
+        df = panel.copy()
+        df[name] = self.is_eligible(panel[S].values, times)
+        return df
+
+    def matrix(self, dates, symbols = None):
+        """
+        Eligibility of symbols on each of the given dates as a boolean
+        dataframe with dates as index and symbols as columns
+        symbols
+            columns of the dataframe; all symbols by default
+        """
+        dates = DatetimeIndex(dates)
+        symbols = self.names if symbols is None else np.asarray(symbols, dtype = object)
+        n = len(dates)
+        S = np.tile(symbols, n)
+        TS = np.repeat(dates.asi8, len(symbols))
+        return DataFrame(self.is_eligible(S, TS).reshape(n, len(symbols)),
+                         index = dates, columns = symbols)
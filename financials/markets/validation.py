@@ -2,6 +2,25 @@
 This module provides validation functions
 """
 
+import numpy as np
+from pandas import Series, factorize
+from financials.utilities.store import Interner
+
+# Reason codes for validation
+PASSED = 0
+NO_CAPITAL = 1
+NO_STOCK = 2
+MAX_WEIGHT = 3
+BAD_MODE = 4
+
+REASONS = {
+    PASSED: "Passed",
+    NO_CAPITAL: "Lack of capital",
+    NO_STOCK: "Stock not in holdings",
+    MAX_WEIGHT: "Max_weight exceeded",
+    BAD_MODE: "Mode different"
+}
+
 def _is_stock_available(avl, ord):
     """
     Whether the stock is available for sale (it must be in holdings)
@@ -14,48 +33,283 @@ def _is_capital_available(cap, ord, lim):
     """
     return True if (cap - ord) >= lim else False
 
+def _group_cumsum(codes, values):
+    """
+    Cumulative sum of values within each code, in the original order
+    """
+    order = np.argsort(codes, kind = "mergesort")
+    c, v = codes[order], values[order]
+    total = np.cumsum(v)
+    start = np.r_[True, c[1:] != c[:-1]]
+    offset = (total - v)[start][np.cumsum(start) - 1]
+    result = np.empty(len(v))
+    result[order] = total - offset
+    return result
+
+def validate(S, Q, P, M, capital, limit = 0, allow_short = False,
+             max_weight = None, mode_keys = ("B", "S"), holdings = None,
+             values = None, initial = None):
+    """
+    Validate a batch of trades
+
+    S, Q, P, M
+        arrays of symbols, quantities, prices and modes
+    capital
+        capital available before the first trade
+    limit
+        limit below which capital shouldn't fall
+    allow_short
+        True to allow short sales
+    max_weight
+        maximum value of a symbol as a fraction of the initial capital
+        A buy must keep the value below it; None for no limit
+    mode_keys
+        a two tuple indicating the BUY and SELL keys
+    holdings
+        dict of quantities already held by symbol
+    values
+        dict of value already invested by symbol
+    initial
+        capital against which max_weight is measured
+        By default, the capital given
+
+    returns a 2-tuple with a boolean array of passed trades and an
+    array of reason codes (see REASONS)
+
+    A trade that fails doesn't change the capital or holdings available
+    to later trades. The checks run on running totals for a block of
+    trades at a time, assuming all of them pass. At the first failure
+    the state is advanced upto that trade and the trades that follow
+    are checked one by one for the length of a block, since failures
+    tend to come together, before trying a whole block again. So the
+    result is the same as checking one by one and the cost stays
+    linear whatever the number of failures
+    """
+    B, Sl = mode_keys
+    S = np.asarray(S, dtype = object)
+    Q = np.asarray(Q, dtype = np.float64)
+    P = np.asarray(P, dtype = np.float64)
+    M = np.asarray(M, dtype = object)
+    n = len(S)
+    reasons = np.zeros(n, dtype = np.int8)
+    if n == 0:
+        return reasons == PASSED, reasons
+    codes, symbols = factorize(S)
+    held = np.zeros(len(symbols))
+    if holdings:
+        held += [holdings.get(s, 0) for s in symbols]
+    invested = np.zeros(len(symbols))
+    if values:
+        invested += [values.get(s, 0) for s in symbols]
+    is_buy, is_sell = M == B, M == Sl
+    reasons[~(is_buy | is_sell)] = BAD_MODE
+    V = P * Q
+    dcap = np.where(is_buy, -V, np.where(is_sell, V, 0.0))
+    dq = np.where(is_buy, Q, np.where(is_sell, -Q, 0.0))
+    dv = np.where(is_buy, V, np.where(is_sell, -V, 0.0))
+    initial = (capital if initial is None else initial) + 0.0
+    valid = reasons == PASSED
+    lists = []
+
+    def one_by_one(start, end, capital):
+        # check trades in sequence on python lists; much faster
+        # than numpy for a single trade
+        if not lists:
+            lists.extend(x.tolist() for x in (codes, valid, is_buy, dcap, dq, dv))
+        c_, valid_, buy_, dcap_, dq_, dv_ = lists
+        qty, val = held.tolist(), invested.tolist()
+        for t in range(start, end):
+            if not valid_[t]:
+                continue
+            c = c_[t]
+            if buy_[t]:
+                if capital + dcap_[t] < limit:
+                    reasons[t] = NO_CAPITAL
+                    continue
+                if max_weight is not None and (val[c] + dv_[t]) / initial >= max_weight:
+                    reasons[t] = MAX_WEIGHT
+                    continue
+            elif not allow_short and qty[c] + dq_[t] < 0:
+                reasons[t] = NO_STOCK
+                continue
+            capital += dcap_[t]
+            qty[c] += dq_[t]
+            val[c] += dv_[t]
+        held[:] = qty
+        invested[:] = val
+        return capital
+
+    # trades checked at once and trades checked one by one after a failure
+    block, run, start = 1024, 32, 0
+    while start < n:
+        end = min(n, start + block)
+        s = slice(start, end)
+        c = codes[s]
+        ok = valid[s]
+        cap = capital + np.cumsum(np.where(ok, dcap[s], 0.0))
+        qty = held[c] + _group_cumsum(c, np.where(ok, dq[s], 0.0))
+        val = invested[c] + _group_cumsum(c, np.where(ok, dv[s], 0.0))
+        fail = np.zeros(end - start, dtype = np.int8)
+        buy, sell = is_buy[s] & ok, is_sell[s] & ok
+        if max_weight is not None:
+            fail[buy & (val / initial >= max_weight)] = MAX_WEIGHT
+        fail[buy & (cap < limit)] = NO_CAPITAL
+        if not allow_short:
+            fail[sell & (qty < 0)] = NO_STOCK
+        bad = np.flatnonzero(fail)
+        upto = bad[0] if len(bad) else end - start
+        # advance the state over the trades that passed
+        done = slice(start, start + upto)
+        ok = valid[done]
+        capital += dcap[done][ok].sum()
+        held += np.bincount(codes[done][ok], weights = dq[done][ok], minlength = len(symbols))
+        invested += np.bincount(codes[done][ok], weights = dv[done][ok], minlength = len(symbols))
+        start += upto
+        if len(bad):
+            block = max(block // 2, 64)
+            run = min(run * 2, 1 << 16)
+            end = min(n, start + run)
+            capital = one_by_one(start, end, capital)
+            start = end
+        else:
+            block = min(block * 2, 1 << 16)
+            run = max(run // 2, 64)
+    return reasons == PASSED, reasons
+
 def _validate_trades(trades, capital, limit = 0, allow_short = False):
     """
     validate whether the trade is feasible
     """
-    value_counter = {}
-    qty_counter = {}
-    validated_trades = []
-    invalidated_trades = []
-
-    def _validate():
-        if M == "S":
-            if allow_short:
-                return True
-            else:
-                if _is_stock_available(qty_counter[S], Q):
-                    return True
-                else:
-                    return False
-        elif M == "B":
-            if _is_capital_available(capital, V, limit):
-                return True
-            else:
-                False
-        else:
-            return False
-
-    for trade in trades:
-        S,P,Q,M = trade["S"], trade["P"], trade["Q"], trade["M"]
-        qty_counter.setdefault(S, 0)
-        value_counter.setdefault(S, 0)
-        V = P*Q
-        if _validate():
-            validated_trades.append(trade)
-            if M == "S":
-                capital += V
-                qty_counter[S] -= Q
-                value_counter[S] -= V
-            else:
-                capital -= V
-                qty_counter[S] += Q
-                value_counter[S] += V
+    if len(trades) == 0:
+        return []
+    cols = [[t[k] for t in trades] for k in ("S", "Q", "P", "M")]
+    passed, _ = validate(*cols, capital = capital, limit = limit,
+                         allow_short = allow_short)
+    return [t for (t, p) in zip(trades, passed) if p]
+
+
+class Validator(object):
+    """
+    Stateful validator for a live stream of orders
+
+    Capital and the quantity and value held in each symbol are kept in
+    compact arrays keyed by interned symbol codes, so each order is
+    checked in constant time. Orders could also be checked in micro
+    batches with the same rules as validate
+    """
+    def __init__(self, capital, limit = 0, allow_short = False, max_weight = None,
+                 mode_keys = ("B", "S"), holdings = None, values = None):
+        """
+        capital
+            capital available
+        limit
+            limit below which capital shouldn't fall
+        allow_short
+            True to allow short sales
+        max_weight
+            maximum value of a symbol as a fraction of the initial capital
+            A buy must keep the value below it
+        mode_keys
+            a two tuple indicating the BUY and SELL keys
+        holdings
+            dict of quantities already held by symbol
+        values
+            dict of value already invested by symbol
+        """
+        self.capital = capital + 0.0
+        self.limit = limit
+        self.allow_short = allow_short
+        self.max_weight = max_weight
+        self._initial = capital + 0.0
+        self._buy, self._sell = mode_keys
+        self._symbols = Interner()
+        self._qty = np.zeros(64)
+        self._val = np.zeros(64)
+        for s, q in (holdings or {}).items():
+            self._qty[self._code(s)] = q
+        for s, v in (values or {}).items():
+            self._val[self._code(s)] = v
+
+    def _code(self, S):
+        """
+        Code for a symbol; the arrays are grown for new symbols
+        """
+        code = self._symbols.code(S)
+        if code >= len(self._qty):
+            self._grow(code + 1)
+        return code
+
+    def _grow(self, size):
+        size = max(size, 2 * len(self._qty))
+        self._qty = np.r_[self._qty, np.zeros(size - len(self._qty))]
+        self._val = np.r_[self._val, np.zeros(size - len(self._val))]
+
+    def check(self, S, Q, P, M, commit = True):
+        """
+        Check a single order
+        commit
+            If True, an accepted order updates the capital and holdings
+        returns a 2-tuple with the result and the reason code
+        """
+        code = self._code(S)
+        V = P * Q
+        if M == self._buy:
+            if self.capital - V < self.limit:
+                return False, NO_CAPITAL
+            if self.max_weight is not None and \
+            (self._val[code] + V) / self._initial >= self.max_weight:
+                return False, MAX_WEIGHT
+            if commit:
+                self.capital -= V
+                self._qty[code] += Q
+                self._val[code] += V
+        elif M == self._sell:
+            if not self.allow_short and self._qty[code] < Q:
+                return False, NO_STOCK
+            if commit:
+                self.capital += V
+                self._qty[code] -= Q
+                self._val[code] -= V
         else:
-            invalidated_trades.append(trade)
+            return False, BAD_MODE
+        return True, PASSED
+
+    def check_batch(self, S, Q, P, M, commit = True):
+        """
+        Check a micro batch of orders in sequence
+        commit
+            If True, accepted orders update the capital and holdings
+        returns a 2-tuple with a boolean array of accepted orders
+        and an array of reason codes
+        """
+        if len(S) == 0:
+            return np.zeros(0, dtype = bool), np.zeros(0, dtype = np.int8)
+        codes = self._symbols.codes(S)
+        if codes.max() >= len(self._qty):
+            self._grow(codes.max() + 1)
+        seen = np.unique(codes)
+        names = self._symbols.values(seen)
+        passed, reasons = validate(S, Q, P, M, self.capital, limit = self.limit,
+                                   allow_short = self.allow_short,
+                                   max_weight = self.max_weight,
+                                   mode_keys = (self._buy, self._sell),
+                                   holdings = dict(zip(names, self._qty[seen])),
+                                   values = dict(zip(names, self._val[seen])),
+                                   initial = self._initial)
+        if commit and passed.any():
+            M = np.asarray(M, dtype = object)[passed]
+            sign = np.where(M == self._buy, 1.0, -1.0)
+            Q = np.asarray(Q, dtype = np.float64)[passed] * sign
+            V = np.asarray(P, dtype = np.float64)[passed] * Q
+            size = len(self._qty)
+            self.capital -= V.sum()
+            self._qty += np.bincount(codes[passed], weights = Q, minlength = size)
+            self._val += np.bincount(codes[passed], weights = V, minlength = size)
+        return passed, reasons
 
-    return validated_trades
\ No newline at end of file
+    @property
+    def holdings(self):
+        """
+        Quantity held by symbol
+        """
+        return Series(self._qty[:len(self._symbols)], index = self._symbols.values())
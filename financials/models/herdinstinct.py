@@ -1,6 +1,7 @@
 from functools import partial
 from pandas import read_csv
 from financials.markets.backtest import BackTest
+from financials.markets.universe import Universe
 from financials.tools.AdvancedGroup import AdvancedGroup
 
 
@@ -13,14 +14,27 @@ class HerdInstinct(BackTest):
         """
         Read the csv file and select symbols
 
+        symbols: list of symbols or a point in time Universe
+            With a Universe, a symbol is selected only on the dates
+            it was eligible
         col: col to apply filter
         kwargs
         ------
         kwargs to the read_csv function
+
+        The file is read once and reused by later calls with the
+        same kwargs
         """
-        df = read_csv(self._source, **kwargs)
-        df = df[df.SERIES == "EQ"]
-        self._data = df[df[col].isin(symbols)].reset_index()
+        key = sorted(kwargs.items())
+        if getattr(self, "_raw", (None, None))[0] != key:
+            df = read_csv(self._source, **kwargs)
+            self._raw = (key, df[df.SERIES == "EQ"])
+        df = self._raw[1]
+        if isinstance(symbols, Universe):
+            keep = symbols.is_eligible(df[col].values, df.TIMESTAMP.values)
+        else:
+            keep = df[col].isin(symbols).values
+        self._data = df[keep].reset_index()
 
     def ordering(self):
         """
@@ -0,0 +1,278 @@
+"""
+Array kernels for technical indicators
+
+All kernels work along the first axis of 1-d or 2-d arrays, so a 2-d
+array holds a series for each column. Missing values at the start of a
+column are skipped; each kernel returns nan where the result isn't yet
+defined. Missing values later on make rolling windows that hold them
+nan, while exponential averages carry over them. Inputs are never
+modified.
+"""
+
+import numpy as np
+
+# Largest growth of the rescaled terms within a block of the IIR filter
+_BLOCK_RANGE = 1e3
+
+def _2d(x):
+    """
+    Float array as 2-d with time along the first axis
+    """
+    x = np.asarray(x, dtype = np.float64)
+    return x.reshape(len(x), -1)
+
+def _shift(x, k = 1):
+    """
+    Shift along the first axis by k rows, filling with nan
+    """
+    k = min(k, len(x))
+    out = np.empty_like(x)
+    out[:k] = np.nan
+    out[k:] = x[:len(x) - k]
+    return out
+
+def first_valid(x):
+    """
+    Index of the first value that is not nan in each column
+    The length of the array for columns with no values
+    """
+    valid = ~np.isnan(x)
+    return np.where(valid.any(axis = 0), valid.argmax(axis = 0), len(x))
+
+def iir(x, alpha):
+    """
+    First order recursive filter y[t] = alpha * x[t] + (1 - alpha) * y[t-1]
+    starting from zero; a missing x[t] leaves y unchanged
+
+    The recursion has the closed form y[t] = alpha * b^k[t] * sum(x[i] / b^k[i])
+    with b = 1 - alpha and k[t] the number of values upto t. It is
+    evaluated in blocks short enough for 1 / b^k to stay small, carrying
+    the last value of each block into the next, so the work is vectorized
+    within a block and across columns
+    """
+    b = 1.0 - alpha
+    missing = np.isnan(x)
+    if b <= 0:
+        return _carry(alpha * x, missing)
+    size = int(max(1, min(len(x), np.log(_BLOCK_RANGE) / -np.log(b))))
+    powers = b ** np.arange(size + 1)
+    values = np.where(missing, 0.0, x)
+    y = np.empty_like(values)
+    carry = np.zeros(x.shape[1:])
+    for start in range(0, len(x), size):
+        block = values[start:start + size]
+        p = powers[np.cumsum(~missing[start:start + size], axis = 0)]
+        y[start:start + len(block)] = p * (alpha * np.cumsum(block / p, axis = 0) + carry)
+        carry = y[start + len(block) - 1]
+    return y
+
+def _carry(x, missing):
+    """
+    Carry the last value forward over missing values; zero before
+    the first value
+    """
+    rows = np.where(missing, 0, np.arange(1, len(x) + 1)[:, None])
+    last = np.maximum.accumulate(rows, axis = 0)
+    out = x[np.maximum(last - 1, 0), np.arange(x.shape[1])]
+    return np.where(last > 0, out, 0.0)
+
+def _window(values, n):
+    """
+    Sums of the last n values along the first axis
+    """
+    total = np.cumsum(np.r_[np.zeros((1, values.shape[1])), values], axis = 0)
+    return total[n:] - total[:-n]
+
+def _deviations(x):
+    """
+    Values measured from the first value of each column, to keep
+    running sums small, along with the mask of missing values
+    """
+    missing = np.isnan(x)
+    ref = np.nan_to_num(x[np.minimum(first_valid(x), len(x) - 1), np.arange(x.shape[1])])
+    return np.where(missing, 0.0, x - ref), missing, ref
+
+def rolling_mean(x, n):
+    """
+    Mean of the last n values
+    """
+    x = _2d(x)
+    out = np.full(x.shape, np.nan)
+    if n <= len(x):
+        d, missing, ref = _deviations(x)
+        out[n - 1:] = np.where(_window(missing, n) == 0, _window(d, n) / n + ref, np.nan)
+    return out
+
+def rolling_std(x, n):
+    """
+    Sample standard deviation of the last n values
+    """
+    x = _2d(x)
+    out = np.full(x.shape, np.nan)
+    if 1 < n <= len(x):
+        d, missing, ref = _deviations(x)
+        s, sq = _window(d, n), _window(d * d, n)
+        var = np.maximum((sq - s * s / n) / (n - 1), 0)
+        out[n - 1:] = np.where(_window(missing, n) == 0, np.sqrt(var), np.nan)
+    return out
+
+def _rolling(x, n, func):
+    """
+    Apply a running maximum or minimum over the last n values
+    Windows are doubled in width and combined along the bits of n
+    """
+    x = _2d(x)
+    result, offset = None, 0
+    current, width = x, 1
+    while n:
+        if n & 1:
+            shifted = current if offset == 0 else _shift(current, offset)
+            result = shifted if result is None else func(result, shifted)
+            offset += width
+        n >>= 1
+        if n:
+            current = func(current, _shift(current, width))
+            width *= 2
+    return result
+
+def rolling_max(x, n):
+    """
+    Maximum of the last n values
+    """
+    return _rolling(x, n, np.maximum)
+
+def rolling_min(x, n):
+    """
+    Minimum of the last n values
+    """
+    return _rolling(x, n, np.minimum)
+
+def ema(x, n, alpha = None):
+    """
+    Exponential moving average
+    The average starts at the mean of the first n values of each column
+    and is nan before that. Missing values later on are skipped; the
+    average carries over them
+    n
+        number of periods
+    alpha
+        smoothing factor; 2 / (n + 1) by default
+    """
+    x = _2d(x)
+    alpha = 2.0 / (n + 1) if alpha is None else alpha
+    rows = np.arange(len(x))[:, None]
+    cols = np.arange(x.shape[1])
+    valid = ~np.isnan(x)
+    count = np.cumsum(valid, axis = 0)
+    # the row of the n-th value of each column
+    found = count[-1] >= n if len(x) else np.zeros(x.shape[1], dtype = bool)
+    start = np.where(found, (count >= n).argmax(axis = 0), len(x))
+    at = np.minimum(start, len(x) - 1)
+    seed = np.cumsum(np.where(valid, x, 0.0), axis = 0)[at, cols] / n
+    # the seed enters the filter as an impulse at the start
+    z = np.where(rows > start, x, 0.0)
+    z[at, cols] += np.where(found, seed / alpha, 0.0)
+    y = iir(z, alpha)
+    y[rows < start] = np.nan
+    return y
+
+def wilder(x, n):
+    """
+    Wilder smoothing; an exponential average with alpha 1 / n
+    """
+    return ema(x, n, alpha = 1.0 / n)
+
+def true_range(H, L, C):
+    """
+    True range; the range between the high and low including
+    the previous close
+    """
+    H, L, C = _2d(H), _2d(L), _2d(C)
+    prev = _shift(C)
+    # the previous close is left out when missing, but not the bar itself
+    return np.fmax(H, prev) - np.fmin(L, prev) + 0 * (H - L)
+
+def clv(H, L, C):
+    """
+    Close location value; 0 when the high and low are the same
+    """
+    H, L, C = _2d(H), _2d(L), _2d(C)
+    spread = H - L
+    with np.errstate(invalid = "ignore", divide = "ignore"):
+        return np.where(spread == 0, 0.0, ((C - L) - (H - C)) / spread)
+
+def ad(H, L, C, V):
+    """
+    Accumulation distribution line
+    """
+    return np.cumsum(np.nan_to_num(clv(H, L, C) * _2d(V)), axis = 0)
+
+def obv(C, V):
+    """
+    On balance volume
+    Volume is added on up days and subtracted on down days
+    """
+    C = _2d(C)
+    direction = np.nan_to_num(np.sign(C - _shift(C)))
+    return np.cumsum(direction * np.nan_to_num(_2d(V)), axis = 0)
+
+def rsi(C, n):
+    """
+    Relative strength index with Wilder smoothing of gains and losses
+    """
+    C = _2d(C)
+    change = C - _shift(C)
+    with np.errstate(invalid = "ignore", divide = "ignore"):
+        gain = wilder(np.where(change > 0, change, np.where(np.isnan(change), np.nan, 0.0)), n)
+        loss = wilder(np.where(change < 0, -change, np.where(np.isnan(change), np.nan, 0.0)), n)
+        return np.where(loss == 0, np.where(gain == 0, 50.0, 100.0),
+                        100 - 100 / (1 + gain / loss))
+
+def adx(H, L, C, n):
+    """
+    Average directional movement index
+    returns the +DI, -DI and ADX arrays
+    """
+    H, L, C = _2d(H), _2d(L), _2d(C)
+    up = H - _shift(H)
+    down = _shift(L) - L
+    missing = np.isnan(up)
+    with np.errstate(invalid = "ignore", divide = "ignore"):
+        plus = np.where(missing, np.nan, np.where((up > down) & (up > 0), up, 0.0))
+        minus = np.where(missing, np.nan, np.where((down > up) & (down > 0), down, 0.0))
+        tr = wilder(np.where(missing, np.nan, true_range(H, L, C)), n)
+        plus_di = np.where(tr == 0, 0.0, 100 * wilder(plus, n) / tr)
+        minus_di = np.where(tr == 0, 0.0, 100 * wilder(minus, n) / tr)
+        total = plus_di + minus_di
+        dx = np.where(total == 0, 0.0, 100 * np.abs(plus_di - minus_di) / total)
+    dx[np.isnan(tr)] = np.nan
+    return plus_di, minus_di, wilder(dx, n)
+
+def bb(C, k, n):
+    """
+    Bollinger bands
+    returns the central, upper and lower bands
+    """
+    sigma = rolling_std(C, n)
+    central = rolling_mean(C, n)
+    return central, central + k * sigma, central - k * sigma
+
+def fs(H, L, C, n1, n2, n3):
+    """
+    Full stochastic oscillator
+    returns the full K and full D lines
+    """
+    low, high = rolling_min(L, n1), rolling_max(H, n1)
+    with np.errstate(invalid = "ignore", divide = "ignore"):
+        fast = (_2d(C) - low) / (high - low) * 100
+    full = rolling_mean(fast, n2)
+    return full, rolling_mean(full, n3)
+
+def macd(C, n1, n2, n3):
+    """
+    Moving average convergence divergence
+    returns the MACD, signal line and histogram
+    """
+    line = ema(C, n1) - ema(C, n2)
+    signal = ema(line, n3)
+    return line, signal, line - signal
@@ -0,0 +1,153 @@
+"""
+Cache of indicator results
+
+Results are keyed by the indicator, its arguments and a fingerprint of
+the price data, so calling an indicator again on unchanged data returns
+the stored result instead of computing it again. The cache holds a
+limited number of results and drops the least recently used; dropped
+results can be kept in a directory and read back when needed again.
+
+>>> from pandas import date_range
+>>> from financials.tools.indicators import SMA
+>>> cache = IndicatorCache(maxsize = 8)
+>>> sma = memoize(SMA, cache)
+>>> S = DataFrame({"C": [1.0, 2.0, 3.0, 4.0]},
+...               index = date_range("2014-01-01", periods = 4))
+>>> sma(S, n = 2).tolist()
+[nan, 1.5, 2.5, 3.5]
+>>> sma(S, n = 2).tolist()
+[nan, 1.5, 2.5, 3.5]
+>>> cache.hits, cache.misses
+(1, 1)
+"""
+
+import os
+import hashlib
+import pickle
+import numpy as np
+from collections import OrderedDict
+from functools import wraps
+from pandas import DataFrame
+
+# start of the names of the files kept by the cache
+_PREFIX = "indicator-cache-"
+
+def fingerprint(df):
+    """
+    Fingerprint of a dataframe or series from its type, shape,
+    index bounds, column names and a hash of its contents
+    """
+    h = hashlib.md5()
+    arrays = [df.index.values]
+    if isinstance(df, DataFrame):
+        arrays.extend(df[c].values for c in df.columns)
+        names = tuple(df.columns)
+    else:
+        arrays.append(df.values)
+        names = df.name
+    for values in arrays:
+        if values.dtype == object:
+            h.update("\0".join(map(str, values)).encode("utf-8"))
+        else:
+            h.update(np.ascontiguousarray(values).view(np.uint8))
+    bounds = (df.index[0], df.index[-1]) if len(df) else (None, None)
+    return (type(df).__name__, df.shape, bounds, names, h.hexdigest())
+
+class IndicatorCache(object):
+    """
+    Least recently used cache of indicator results
+    """
+    def __init__(self, maxsize = 128, path = None):
+        """
+        maxsize
+            number of results kept in memory
+        path
+            directory to keep results dropped from memory
+            results are not kept if None
+        """
+        self.maxsize = maxsize
+        self.path = path
+        self._data = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        if path is not None and not os.path.isdir(path):
+            os.makedirs(path)
+
+    def __repr__(self):
+        return "IndicatorCache: {N} results, {H} hits, {M} misses".format \
+                (N = len(self._data), H = self.hits, M = self.misses)
+
+    def __len__(self):
+        return len(self._data)
+
+    def _file(self, key):
+        return os.path.join(self.path, _PREFIX + hashlib.md5(repr(key).encode("utf-8"))
+                            .hexdigest() + ".pkl")
+
+    def get(self, key):
+        """
+        Result stored for the key or None
+        """
+        if key in self._data:
+            self._data[key] = value = self._data.pop(key)
+            self.hits += 1
+            return value
+        if self.path is not None and os.path.exists(self._file(key)):
+            with open(self._file(key), "rb") as f:
+                value = pickle.load(f)
+            self.hits += 1
+            self.put(key, value)
+            return value
+        self.misses += 1
+        return None
+
+    def put(self, key, value):
+        """
+        Store a result, dropping the least recently used if full
+        """
+        self._data.pop(key, None)
+        self._data[key] = value
+        while len(self._data) > self.maxsize:
+            old, result = self._data.popitem(last = False)
+            if self.path is not None:
+                with open(self._file(old), "wb") as f:
+                    pickle.dump(result, f, pickle.HIGHEST_PROTOCOL)
+
+    def clear(self):
+        """
+        Drop all results and reset the counters
+        Results kept in the directory are removed; other files in
+        the directory are left alone
+        """
+        self._data.clear()
+        self.hits = self.misses = 0
+        if self.path is not None:
+            for name in os.listdir(self.path):
+                if name.startswith(_PREFIX) and name.endswith(".pkl"):
+                    os.remove(os.path.join(self.path, name))
+
+# cache used when none is given to memoize
+CACHE = IndicatorCache()
+
+def memoize(function, cache = None):
+    """
+    Wrap an indicator function so its results are cached
+    function
+        indicator taking the price data as the first argument
+    cache
+        IndicatorCache to use; the module CACHE by default
+
+    Arguments must be hashable. A copy of the result is returned
+    so the cached one can't be changed
+    """
+    @wraps(function)
+    def wrapped(S, *args, **kwargs):
+        store = CACHE if cache is None else cache
+        key = (function.__module__, function.__name__, fingerprint(S),
+               args, tuple(sorted(kwargs.items())))
+        result = store.get(key)
+        if result is None:
+            result = function(S, *args, **kwargs)
+            store.put(key, result)
+        return result.copy()
+    return wrapped
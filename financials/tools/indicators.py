@@ -7,22 +7,39 @@ Stock must be a dataframe with date as index and the following columns
  * L - Low
  * C - Close
  * V - Volume
+
+The calculations are done by the array kernels in _kernels; the stock
+dataframe is never modified
 """
 
-from pandas import DataFrame, rolling_mean, rolling_std, rolling_max, rolling_min
+from pandas import DataFrame, Series
+from financials.tools import _kernels as K
 from financials.utilities.decorators import *
 
+def _series(S, values, name):
+    """
+    Series with the index of the stock from a kernel result
+    """
+    return Series(values.ravel(), index = S.index, name = name)
+
+def _frame(S, columns, *values):
+    """
+    Dataframe with the index of the stock from kernel results
+    """
+    return DataFrame(dict(zip(columns, [v.ravel() for v in values])),
+                     index = S.index, columns = columns)
+
 def CLV(S, **kwargs):
     """
     Calculates the Close Location Value
     """
-    return ((S.C - S.L) - (S.H - S.C))/(S.H - S.L)
+    return _series(S, K.clv(S.H, S.L, S.C), "CLV")
 
 def TR(S, **kwargs):
     """
     Calculate the True Range
     """
-    return DataFrame([S.H - S.L, S.H - S.C.shift(1), S.C.shift(1) - S.L]).T.max(axis = 1)
+    return _series(S, K.true_range(S.H, S.L, S.C), "TR")
 
 @period
 @frequency
@@ -30,35 +47,26 @@ def AD(S, **kwargs):
     """
     Calculates the Accumulation/Distribution line
     """
-    return (S.V * CLV(S)).cumsum()
+    return _series(S, K.ad(S.H, S.L, S.C, S.V), "AD")
 
 @period
 @frequency
 def ADX(S, n = 14, **kwargs):
     """
     Calculates the Average Directional Movement Index
+    Directional movement and true range are smoothed with Wilder's method
     """
-    plus_DM = S.H - S.H.shift(1)
-    minus_DM = S.L.shift(1) - S.L
-    TrueRange = TR(S)
-    plus_DM_n = ((plus_DM.shift(1) * (n-1)) + plus_DM) / n
-    minus_DM_n = ((minus_DM.shift(1) * (n-1)) + minus_DM) / n
-    TrueRangen_n = ((TrueRange.shift(1) * (n-1)) + TrueRange) / n
-    plus_DI_n = plus_DM_n / TrueRange_n
-    minus_DI_n = minus_DM_n / TrueRange_n
-    DI = abs(plus_DI_n - minus_DI_n)
-    DX = DI / DataFrame([plus_DI_n, minus_DI_n]).T.sum(axis = 1)
-    adx = (DX.shift * (n-1) + DX) / n
-    return adx
+    return _series(S, K.adx(S.H, S.L, S.C, n)[2], "ADX")
 
 @period
 @frequency
-def ATR(S, n = 14):
+def ATR(S, n = 14, **kwargs):
     """
     Calculate the Average True Range
+    Wilder smoothing of the true range starting from the mean of
+    the first n values
     """
-    TrueRange = TR(S)
-    return ((TrueRange.shift(1) * (n-1)) + TrueRange) / n
+    return _series(S, K.wilder(K.true_range(S.H, S.L, S.C), n), "ATR")
 
 @period
 @frequency
@@ -66,16 +74,16 @@ def SMA(S, n = 7, **kwargs):
     """
     Calculates the simple moving average
     """
-    return rolling_mean(S.C, n)
+    return _series(S, K.rolling_mean(S.C, n), "SMA")
 
 @period
 @frequency
 def EMA(S, n = 7, **kwargs):
     """
     Calculates the exponential moving average
+    The average starts from the simple average of the first n values
     """
-    alpha = 2.0 / (n+1)
-    return S.C * alpha + (S.C.shift(1) * (1 - alpha))
+    return _series(S, K.ema(S.C, n), "EMA")
 
 @period
 @frequency
@@ -83,11 +91,7 @@ def BB(S, k = 2, n = 14, **kwargs):
     """
     Calcuate the bollinger bands
     """
-    sigma = rolling_std(S.C, n)
-    central_band = SMA(S, n)
-    upper_band = central_band + (k * sigma)
-    lower_band = central_band - (k * sigma)
-    return DataFrame([central_band, upper_band, lower_band]).T
+    return _frame(S, ["CentralBand", "UpperBand", "LowerBand"], *K.bb(S.C, k, n))
 
 @period
 @frequency
@@ -95,23 +99,16 @@ def FS(S, n1 = 7, n2 = 5, n3 = 5, **kwargs):
     """
     Calculate the Full Stochastic momentum indicator
     """
-    S['MinLow'] = rolling_min(S.L, n1)
-    S['MaxHigh'] = rolling_max(S.L, n1)
-    K_fast = ((S.C - S.MinLow) / (S.MaxHigh - S.MinLow)) * 100
-    K_full = rolling_mean(K_fast, n2)
-    D_full = rolling_mean(K_full, n3)
-    return DataFrame([K_full, D_full]).T
+    return _frame(S, ["K_full", "D_full"], *K.fs(S.H, S.L, S.C, n1, n2, n3))
 
 @period
 @frequency
 def MACD(S, n1 = 12, n2 = 26, n3 = 9, **kwargs):
     """
     Calculate the Moving Average Convergence Divergence
+    The signal line is the exponential average of MACD over n3 periods
     """
-    macd = EMA(S, n1) - EMA(S, n2)
-    signal_line = rolling_mean(macd, 9)
-    histogram = macd - signal_line
-    return DataFrame([macd, signal_line, histogram]).T
+    return _frame(S, ["MACD", "SignalLine", "Hist"], *K.macd(S.C, n1, n2, n3))
 
 @period
 @frequency
@@ -119,9 +116,7 @@ def OBV(S, **kwargs):
     """
     Calculate the On Balance Volume
     """
-    S['Indicate'] = S.C - S.C.shift(1)
-    S['OBV'] = [V if P > 0 else -V for (P,V) in zip(S.Indicate, S.V)]
-    return S.OBV.cumsum()
+    return _series(S, K.obv(S.C, S.V), "OBV")
 
 
 @period
@@ -129,30 +124,15 @@ def OBV(S, **kwargs):
 def RSI(S, n = 7, **kwargs):
     """
     Calculate the Relative Strength Index
+    Gains and losses are smoothed with Wilder's method
     """
-    gain = []
-    loss = []
-    for (a,b) in zip(S.C, S.C.shift(1)):
-        if a > b:
-            gain.append(a - b)
-            loss.append(0)
-        else:
-            loss.append(b - a)
-            gain.append(0)
-    S['Gain'] = gain
-    S['Loss'] = loss
-    initial_gain = rolling_mean(S.Gain, n)
-    average_gain = ((initial_gain.shift(1) * (n - 1)) / initial_gain) / n
-    initial_loss = rolling_mean(S.Loss, n)
-    average_loss = ((initial_loss.shift(1) * (n -1)) / initial_loss) / n
-    RS = average_gain / average_loss
-    rsi = 100 - (100 / (1 + RS))
-    return rsi
+    return _series(S, K.rsi(S.C, n), "RSI")
 
 @period
 @frequency
-def SR(S, **kwargs):
+def SR(S, n = 1, **kwargs):
     """
     Returns the support resistance levels
     """
-    return DataFrame([rolling_min(S.L, 1), rolling_max(S.H, 1)]).T
+    return _frame(S, ["Support", "Resistance"], K.rolling_min(S.L, n),
+                  K.rolling_max(S.H, n))
@@ -0,0 +1,137 @@
+"""
+Technical indicators for many symbols at once
+
+Bars of all symbols are laid out as 2-d arrays with a column for each
+symbol. Each symbol's bars are stacked from the first row in time
+order, so the columns are series of their own and padded with nan at
+the end; the kernels then run along the time axis for all symbols in
+one call and every symbol gets the same result as computing it alone.
+
+Indicators are given by name with the same defaults as the functions
+in indicators, or as a 2-tuple of the name and a dict of arguments
+ * SMA, EMA, BB, ATR, RSI, MACD, FS, OBV, AD, ADX
+"""
+
+import numpy as np
+from pandas import DataFrame, factorize
+from financials.tools import _kernels as K
+
+_FIELDS = ["O", "H", "L", "C", "V"]
+
+# name: (output columns, function of the arrays returning the outputs)
+_INDICATORS = {
+    "SMA": (["SMA"], lambda P, n = 7: (K.rolling_mean(P["C"], n),)),
+    "EMA": (["EMA"], lambda P, n = 7: (K.ema(P["C"], n),)),
+    "BB": (["CentralBand", "UpperBand", "LowerBand"],
+           lambda P, k = 2, n = 14: K.bb(P["C"], k, n)),
+    "ATR": (["ATR"], lambda P, n = 14:
+            (K.wilder(K.true_range(P["H"], P["L"], P["C"]), n),)),
+    "RSI": (["RSI"], lambda P, n = 7: (K.rsi(P["C"], n),)),
+    "MACD": (["MACD", "SignalLine", "Hist"],
+             lambda P, n1 = 12, n2 = 26, n3 = 9: K.macd(P["C"], n1, n2, n3)),
+    "FS": (["K_full", "D_full"],
+           lambda P, n1 = 7, n2 = 5, n3 = 5: K.fs(P["H"], P["L"], P["C"], n1, n2, n3)),
+    "OBV": (["OBV"], lambda P: (K.obv(P["C"], P["V"]),)),
+    "AD": (["AD"], lambda P: (K.ad(P["H"], P["L"], P["C"], P["V"]),)),
+    "ADX": (["ADX"], lambda P, n = 14: (K.adx(P["H"], P["L"], P["C"], n)[2],)),
+}
+
+def _spec(indicator):
+    """
+    Name, arguments and output column names of an indicator
+    Arguments are added to the column names when given
+    """
+    if isinstance(indicator, tuple):
+        name, kwargs = indicator
+    else:
+        name, kwargs = indicator, {}
+    columns, func = _INDICATORS[name]
+    suffix = "".join("_{0}".format(kwargs[k]) for k in sorted(kwargs))
+    return func, kwargs, [c + suffix for c in columns]
+
+class Layout(object):
+    """
+    Position of each bar of a long dataframe in the 2-d arrays
+    """
+    def __init__(self, df, S = "S"):
+        """
+        df
+            dataframe of bars with datetime index and a symbol column
+        S
+            column with the symbol
+        """
+        codes, self.symbols = factorize(df[S].values, sort = True)
+        times = df.index.asi8
+        order = np.lexsort((times, codes))
+        # position of each bar within its symbol
+        start = np.r_[True, codes[order][1:] != codes[order][:-1]]
+        index = np.arange(len(order))
+        offset = np.maximum.accumulate(np.where(start, index, 0))
+        self.rows = np.empty(len(order), dtype = np.int64)
+        self.rows[order] = index - offset
+        self.columns = codes
+        self.times = times
+        self.shape = (self.rows.max() + 1 if len(order) else 0, len(self.symbols))
+
+    def to_array(self, values):
+        """
+        2-d array of the values of a column
+        """
+        out = np.full(self.shape, np.nan)
+        out[self.rows, self.columns] = values
+        return out
+
+    def to_wide(self, array):
+        """
+        Dataframe with dates as index and symbols as columns
+        """
+        dates, rows = np.unique(self.times, return_inverse = True)
+        out = np.full((len(dates), len(self.symbols)), np.nan)
+        out[rows, self.columns] = array[self.rows, self.columns]
+        return DataFrame(out, index = dates.view("datetime64[ns]"),
+                         columns = self.symbols)
+
+def run(P, indicators):
+    """
+    Indicators over 2-d arrays
+    P
+        dict of 2-d arrays with time along the rows and a column for
+        each symbol; keys are the field names O, H, L, C, V
+        Columns may have nan at the start or the end but not in between
+    indicators
+        list of indicator names or 2-tuples of name and arguments
+    returns a dict of 2-d arrays, one for each output column
+    """
+    result = {}
+    for indicator in indicators:
+        func, kwargs, columns = _spec(indicator)
+        for c, values in zip(columns, func(P, **kwargs)):
+            result[c] = values
+    return result
+
+def compute(df, indicators, S = "S", long = True):
+    """
+    Indicators for all the symbols in a dataframe of bars
+    df
+        dataframe with datetime index, a symbol column and the columns
+        O, H, L, C, V as needed by the indicators
+    indicators
+        list of indicator names or 2-tuples of name and arguments
+    S
+        column with the symbol
+    long
+        If True, returns a dataframe aligned with the rows of df with
+        a column for each output
+        If False, returns a dict of dataframes with dates as index and
+        symbols as columns, one for each output
+    """
+    layout = Layout(df, S)
+    P = dict((f, layout.to_array(df[f].values)) for f in _FIELDS if f in df.columns)
+    result = run(P, indicators)
+    columns = []
+    for indicator in indicators:
+        columns.extend(_spec(indicator)[2])
+    if long:
+        data = dict((c, result[c][layout.rows, layout.columns]) for c in columns)
+        return DataFrame(data, index = df.index, columns = columns)
+    return dict((c, layout.to_wide(result[c])) for c in columns)
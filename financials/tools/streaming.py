@@ -0,0 +1,281 @@
+"""
+Streaming versions of the technical indicators
+
+Each indicator keeps the state it needs to update its value as bars
+arrive one at a time, so a new bar costs O(1) and the state is at most
+the size of the window. Values follow the same conventions as the
+functions in indicators, so feeding a series bar by bar gives the same
+values as computing it in one go; nan is returned until a value is
+defined. As in the batch versions, rolling windows that hold a missing
+value are nan and exponential averages carry over missing values.
+
+The state of an indicator is a dict of numbers, lists and dicts of
+them, taken with snapshot and put back with restore, so it can be
+pickled or stored as JSON and carried across sessions. Streams keeps
+an indicator for each symbol.
+"""
+
+import copy
+from math import sqrt
+
+NAN = float("nan")
+
+class _Indicator(object):
+    """
+    Base of the streaming indicators
+    """
+    def snapshot(self):
+        """
+        State of the indicator as a dict of numbers, lists and tuples
+        Windows and smoothers are given as dicts of their own
+        """
+        state = {}
+        for k, v in self.__dict__.items():
+            if isinstance(v, (_Window, _Smoother)):
+                v = v.__dict__
+            state[k] = copy.deepcopy(v)
+        return state
+
+    def restore(self, state):
+        """
+        Put back a state taken with snapshot
+        """
+        for k, v in state.items():
+            current = getattr(self, k, None)
+            if isinstance(current, (_Window, _Smoother)):
+                current.__dict__.update(copy.deepcopy(v))
+            else:
+                setattr(self, k, copy.deepcopy(v))
+        return self
+
+class _Window(object):
+    """
+    Ring buffer of the last n values
+    along with the number of missing values among them
+    """
+    def __init__(self, n):
+        self.values = [0.0] * n
+        self.count = 0
+        self.missing = 0
+
+    def push(self, x):
+        """
+        Add a value and return the value it replaces or None
+        while the window is filling
+        """
+        n = len(self.values)
+        at = self.count % n
+        old = self.values[at] if self.count >= n else None
+        self.values[at] = x
+        self.count += 1
+        if x != x:
+            self.missing += 1
+        if old is not None and old != old:
+            self.missing -= 1
+        return old
+
+    def full(self):
+        """
+        Whether the window is filled with values, none missing
+        """
+        return self.count >= len(self.values) and self.missing == 0
+
+class _Smoother(object):
+    """
+    Exponential smoothing started at the mean of the first n values
+    """
+    def __init__(self, n, alpha):
+        self.n = n
+        self.alpha = alpha
+        self.count = 0
+        self.value = NAN
+
+    def update(self, x):
+        # missing values are skipped; the value carries over them
+        if x != x:
+            return self.value if self.count >= self.n else NAN
+        if self.count < self.n:
+            self.count += 1
+            self.value = x if self.count == 1 else self.value + x
+            if self.count < self.n:
+                return NAN
+            self.value /= self.n
+        else:
+            self.value = self.alpha * x + (1 - self.alpha) * self.value
+        return self.value
+
+class SMA(_Indicator):
+    """
+    Simple moving average of the close
+    """
+    def __init__(self, n = 7):
+        self.window = _Window(n)
+        # sum of the values in the window that aren't missing
+        self.total = 0.0
+        self.value = NAN
+
+    def update(self, C):
+        old = self.window.push(C)
+        if C == C:
+            self.total += C
+        if old is not None and old == old:
+            self.total -= old
+        if self.window.full():
+            self.value = self.total / len(self.window.values)
+        else:
+            self.value = NAN
+        return self.value
+
+class EMA(_Indicator):
+    """
+    Exponential moving average of the close
+    """
+    def __init__(self, n = 7):
+        self.smoother = _Smoother(n, 2.0 / (n + 1))
+        self.value = NAN
+
+    def update(self, C):
+        self.value = self.smoother.update(C)
+        return self.value
+
+class BB(_Indicator):
+    """
+    Bollinger bands of the close
+    returns the central, upper and lower bands
+    """
+    def __init__(self, k = 2, n = 14):
+        self.k = k
+        self.window = _Window(n)
+        # mean and sum of squared deviations of the values in the
+        # window that aren't missing
+        self.size = 0
+        self.mean = 0.0
+        self.squares = 0.0
+        self.value = (NAN, NAN, NAN)
+
+    def update(self, C):
+        n = len(self.window.values)
+        old = self.window.push(C)
+        if old is not None and old == old:
+            self.size -= 1
+            if self.size == 0:
+                self.mean = self.squares = 0.0
+            else:
+                mean = self.mean
+                self.mean -= (old - mean) / self.size
+                self.squares -= (old - mean) * (old - self.mean)
+        if C == C:
+            self.size += 1
+            mean = self.mean
+            self.mean += (C - mean) / self.size
+            self.squares += (C - mean) * (C - self.mean)
+        if self.window.full() and n > 1:
+            sigma = sqrt(max(self.squares, 0.0) / (n - 1))
+            self.value = (self.mean, self.mean + self.k * sigma,
+                          self.mean - self.k * sigma)
+        else:
+            self.value = (NAN, NAN, NAN)
+        return self.value
+
+class ATR(_Indicator):
+    """
+    Average true range with Wilder smoothing
+    """
+    def __init__(self, n = 14):
+        self.smoother = _Smoother(n, 1.0 / n)
+        self.close = None
+        self.value = NAN
+
+    def update(self, H, L, C):
+        if self.close is None:
+            TR = H - L
+        else:
+            TR = max(H, self.close) - min(L, self.close)
+        self.close = C
+        self.value = self.smoother.update(TR)
+        return self.value
+
+class RSI(_Indicator):
+    """
+    Relative strength index with Wilder smoothing of gains and losses
+    """
+    def __init__(self, n = 7):
+        self.gain = _Smoother(n, 1.0 / n)
+        self.loss = _Smoother(n, 1.0 / n)
+        self.close = None
+        self.value = NAN
+
+    def update(self, C):
+        if self.close is not None:
+            change = C - self.close
+            gain = self.gain.update(max(change, 0.0))
+            loss = self.loss.update(max(-change, 0.0))
+            if loss == 0:
+                self.value = 50.0 if gain == 0 else 100.0
+            elif loss == loss:
+                self.value = 100 - 100 / (1 + gain / loss)
+        self.close = C
+        return self.value
+
+class MACD(_Indicator):
+    """
+    Moving average convergence divergence of the close
+    returns the MACD, signal line and histogram
+    """
+    def __init__(self, n1 = 12, n2 = 26, n3 = 9):
+        self.fast = _Smoother(n1, 2.0 / (n1 + 1))
+        self.slow = _Smoother(n2, 2.0 / (n2 + 1))
+        self.signal = _Smoother(n3, 2.0 / (n3 + 1))
+        self.value = (NAN, NAN, NAN)
+
+    def update(self, C):
+        line = self.fast.update(C) - self.slow.update(C)
+        signal = self.signal.update(line)
+        self.value = (line, signal, line - signal)
+        return self.value
+
+class Streams(object):
+    """
+    A streaming indicator for each symbol
+    >>> streams = Streams(SMA, n = 2)
+    >>> streams.update("A", 10.0), streams.update("B", 5.0)
+    (nan, nan)
+    >>> streams.update("A", 12.0), streams.update("B", 7.0)
+    (11.0, 6.0)
+    """
+    def __init__(self, indicator, **kwargs):
+        """
+        indicator
+            one of the streaming indicator classes
+        kwargs
+            arguments of the indicator
+        """
+        self.indicator = indicator
+        self.kwargs = kwargs
+        self.streams = {}
+
+    def __getitem__(self, symbol):
+        if symbol not in self.streams:
+            self.streams[symbol] = self.indicator(**self.kwargs)
+        return self.streams[symbol]
+
+    def update(self, symbol, *bar):
+        """
+        Update the indicator of a symbol with a new bar
+        and return its value
+        """
+        return self[symbol].update(*bar)
+
+    def snapshot(self):
+        """
+        State of the indicators of all symbols
+        """
+        return dict((s, v.snapshot()) for (s, v) in self.streams.items())
+
+    def restore(self, state):
+        """
+        Put back a state taken with snapshot
+        """
+        self.streams = dict((s, self.indicator(**self.kwargs).restore(v))
+                            for (s, v) in state.items())
+        return self
@@ -0,0 +1,41 @@
+import os
+import shutil
+import tempfile
+import numpy as np
+from pandas import DataFrame, date_range
+from financials.tools.cache import IndicatorCache, fingerprint, memoize
+from financials.tools.indicators import SMA, BB
+
+np.random.seed(4)
+S = DataFrame({"C": 100 + np.cumsum(np.random.randn(100))},
+              index = date_range("2010-01-01", periods = 100))
+
+def test_fingerprint():
+    changed = S.copy()
+    assert fingerprint(changed) == fingerprint(S)
+    changed.iloc[50, 0] += 1
+    assert fingerprint(changed) != fingerprint(S)
+    assert fingerprint(S.iloc[:50]) != fingerprint(S)
+
+def test_memoize():
+    path = tempfile.mkdtemp()
+    try:
+        cache = IndicatorCache(maxsize = 2, path = path)
+        sma, bb = memoize(SMA, cache), memoize(BB, cache)
+        first = sma(S, n = 20)
+        first[:] = 0
+        assert sma(S, n = 20).equals(SMA(S, n = 20))
+        sma(S, n = 10)
+        bb(S, n = 20)
+        # the first result was dropped from memory but kept on disk
+        assert len(cache) == 2
+        assert sma(S, n = 20).equals(SMA(S, n = 20))
+        assert bb(S, n = 20, f = "2010-02-01").equals(BB(S, n = 20, f = "2010-02-01"))
+        assert (cache.hits, cache.misses) == (2, 4)
+        other = os.path.join(path, "other.pkl")
+        open(other, "wb").close()
+        cache.clear()
+        assert len(cache) == 0
+        assert os.listdir(path) == ["other.pkl"]
+    finally:
+        shutil.rmtree(path)
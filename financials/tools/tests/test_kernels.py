@@ -0,0 +1,72 @@
+import numpy as np
+from pandas import DataFrame, date_range
+from financials.tools import _kernels as K
+from financials.tools.indicators import EMA, ATR, RSI, MACD, FS, OBV
+
+np.random.seed(0)
+n = 300
+C = 100 + np.cumsum(np.random.randn(n))
+O = C + np.random.randn(n) * 0.2
+H = np.maximum(O, C) + abs(np.random.randn(n))
+L = np.minimum(O, C) - abs(np.random.randn(n))
+V = np.random.randint(100, 1000, n).astype(float)
+df = DataFrame({"O": O, "H": H, "L": L, "C": C, "V": V},
+               index = date_range("2010-01-01", periods = n))
+
+def ema(x, n, alpha = None):
+    """
+    Exponential average by recursion, seeded with the mean of the
+    first n values and carried over missing values
+    """
+    alpha = 2.0 / (n + 1) if alpha is None else alpha
+    out = np.full(len(x), np.nan)
+    valid = np.flatnonzero(~np.isnan(x))
+    y = np.mean(x[valid[:n]])
+    out[valid[n - 1]] = y
+    for t in range(valid[n - 1] + 1, len(x)):
+        if not np.isnan(x[t]):
+            y = alpha * x[t] + (1 - alpha) * y
+        out[t] = y
+    return out
+
+def check(a, b):
+    assert np.allclose(np.asarray(a, dtype = float), b, equal_nan = True)
+
+def test_iir():
+    # long series and slow filters cross many blocks
+    x = np.random.randn(5000)
+    check(K.ema(x, 200).ravel(), ema(x, 200))
+    check(K.ema(np.r_[np.nan, np.nan, x], 5).ravel(), ema(np.r_[np.nan, np.nan, x], 5))
+
+def test_missing():
+    # a missing value after the start is skipped, not carried as nan
+    x = np.random.randn(300)
+    x[[3, 100, 101, 250]] = np.nan
+    check(K.ema(x, 10).ravel(), ema(x, 10))
+    check(K.wilder(x, 5).ravel(), ema(x, 5, 1.0 / 5))
+    gap = df.copy()
+    gap.iloc[40, :] = np.nan
+    assert RSI(gap, n = 14).iloc[42:].notnull().all()
+    assert MACD(gap).iloc[42:].notnull().all().all()
+    assert ATR(gap, n = 14).iloc[42:].notnull().all()
+
+def test_rolling():
+    x = np.r_[np.random.randn(50), np.nan, np.random.randn(50)]
+    for w in (1, 5, 13):
+        expected = [x[t - w + 1:t + 1].max() if t >= w - 1 else np.nan for t in range(len(x))]
+        check(K.rolling_max(x, w).ravel(), expected)
+
+def test_indicators():
+    before = df.copy()
+    check(EMA(df, n = 10), ema(C, 10))
+    TR = np.r_[H[0] - L[0], np.maximum(H[1:], C[:-1]) - np.minimum(L[1:], C[:-1])]
+    check(ATR(df, n = 14), ema(TR, 14, 1.0 / 14))
+    change = np.r_[np.nan, np.diff(C)]
+    gain = ema(np.where(change > 0, change, 0.0) + 0 * change, 14, 1.0 / 14)
+    loss = ema(np.where(change < 0, -change, 0.0) + 0 * change, 14, 1.0 / 14)
+    check(RSI(df, n = 14), 100 - 100 / (1 + gain / loss))
+    macd = ema(C, 12) - ema(C, 26)
+    check(MACD(df).SignalLine, ema(macd, 9))
+    check(OBV(df), np.cumsum(np.r_[0, np.sign(np.diff(C)) * V[1:]]))
+    assert list(FS(df).columns) == ["K_full", "D_full"]
+    assert df.equals(before)
@@ -0,0 +1,45 @@
+import numpy as np
+from pandas import DataFrame, concat, date_range
+from financials.tools import panel
+from financials.tools import indicators
+
+def bars(symbol, start, n):
+    C = 100 + np.cumsum(np.random.randn(n))
+    O = C + np.random.randn(n) * 0.2
+    H = np.maximum(O, C) + abs(np.random.randn(n))
+    L = np.minimum(O, C) - abs(np.random.randn(n))
+    V = np.random.randint(100, 1000, n).astype(float)
+    return DataFrame({"O": O, "H": H, "L": L, "C": C, "V": V, "S": symbol},
+                     index = date_range(start, periods = n))
+
+np.random.seed(1)
+# symbols of different lengths and dates, shuffled together
+frames = [bars("A", "2010-01-01", 120), bars("B", "2010-02-15", 80),
+          bars("C", "2010-01-10", 5)]
+df = concat(frames).iloc[np.random.permutation(205)]
+
+def test_compute():
+    specs = ["SMA", "EMA", "BB", "ATR", "RSI", "MACD", "FS", "OBV", "AD", "ADX",
+             ("SMA", {"n": 20})]
+    result = panel.compute(df, specs)
+    assert result.index.equals(df.index)
+    for S in frames:
+        rows = (df.S == S.S.iloc[0]).values
+        for name, kwargs, column in [("SMA", {}, "SMA"), ("EMA", {}, "EMA"),
+                                     ("BB", {}, "UpperBand"), ("ATR", {}, "ATR"),
+                                     ("RSI", {}, "RSI"), ("MACD", {}, "Hist"),
+                                     ("FS", {}, "D_full"), ("OBV", {}, "OBV"),
+                                     ("AD", {}, "AD"), ("ADX", {}, "ADX"),
+                                     ("SMA", {"n": 20}, "SMA_20")]:
+            expected = getattr(indicators, name)(S, **kwargs)
+            if isinstance(expected, DataFrame):
+                expected = expected[column.split("_")[0] if column == "SMA_20" else column]
+            got = result[column][rows].sort_index()
+            assert np.allclose(got.values, expected.values, equal_nan = True), (S.S.iloc[0], column)
+
+def test_wide():
+    wide = panel.compute(df, ["SMA"], long = False)["SMA"]
+    assert list(wide.columns) == ["A", "B", "C"]
+    expected = indicators.SMA(frames[1])
+    assert np.allclose(wide["B"].dropna().values, expected.dropna().values)
+    assert wide["C"].isnull().all()
@@ -0,0 +1,57 @@
+import json
+import pickle
+import numpy as np
+from pandas import DataFrame, date_range
+from financials.tools import streaming
+from financials.tools.indicators import SMA, EMA, BB, ATR, RSI, MACD
+
+np.random.seed(3)
+n = 400
+C = 100 + np.cumsum(np.random.randn(n))
+H = C + abs(np.random.randn(n))
+L = C - abs(np.random.randn(n))
+df = DataFrame({"H": H, "L": L, "C": C, "O": C, "V": 1.0},
+               index = date_range("2010-01-01", periods = n))
+
+def feed(indicator, *columns):
+    return np.array([indicator.update(*bar) for bar in zip(*columns)])
+
+def check(a, b):
+    assert np.allclose(np.asarray(a, dtype = float), np.asarray(b, dtype = float),
+                       equal_nan = True)
+
+def test_parity():
+    check(feed(streaming.SMA(n = 20), C), SMA(df, n = 20))
+    check(feed(streaming.EMA(n = 10), C), EMA(df, n = 10))
+    check(feed(streaming.BB(k = 2, n = 14), C), BB(df, k = 2, n = 14))
+    check(feed(streaming.ATR(n = 14), H, L, C), ATR(df, n = 14))
+    check(feed(streaming.RSI(n = 7), C), RSI(df, n = 7))
+    check(feed(streaming.MACD(), C), MACD(df))
+
+def test_missing():
+    gap = df.copy()
+    gap.iloc[[5, 60, 61], :] = np.nan
+    H, L, C = gap.H.values, gap.L.values, gap.C.values
+    check(feed(streaming.SMA(n = 5), C), SMA(gap, n = 5))
+    check(feed(streaming.BB(k = 2, n = 5), C), BB(gap, k = 2, n = 5))
+    check(feed(streaming.EMA(n = 10), C), EMA(gap, n = 10))
+    check(feed(streaming.ATR(n = 14), H, L, C), ATR(gap, n = 14))
+    check(feed(streaming.RSI(n = 7), C), RSI(gap, n = 7))
+    check(feed(streaming.MACD(), C), MACD(gap))
+
+def test_snapshot():
+    # a restored indicator carries on as if never stopped
+    for indicator in (streaming.BB(), streaming.RSI(), streaming.MACD()):
+        feed(indicator, C[:150])
+        state = pickle.loads(pickle.dumps(indicator.snapshot()))
+        expected = feed(indicator, C[150:])
+        restored = type(indicator)().restore(state)
+        check(feed(restored, C[150:]), expected)
+        # the state is made of plain values only
+        restored = type(indicator)().restore(json.loads(json.dumps(state)))
+        check(feed(restored, C[150:]), expected)
+    streams = streaming.Streams(streaming.ATR, n = 5)
+    for bar in zip(H[:50], L[:50], C[:50]):
+        streams.update("A", *bar)
+    copy = streaming.Streams(streaming.ATR, n = 5).restore(streams.snapshot())
+    assert copy.update("A", 101.0, 99.0, 100.0) == streams.update("A", 101.0, 99.0, 100.0)
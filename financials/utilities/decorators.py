@@ -2,6 +2,7 @@
 
 from functools import wraps
 from pandas import DataFrame, Series, DatetimeIndex
+from pandas.tseries.frequencies import to_offset
 
 def clean_up(function):
     """
@@ -18,14 +19,18 @@ def clean_up(function):
     def wrapped(df, set_index = None, convert_to_datetimeindex = None, \
     sort_index = None, *args, **kwargs):
 
-        if convert_to_datetimeindex is True:
-            df[set_index] = DatetimeIndex(df[set_index])
+        # the caller's frame is never modified; a new frame is made
+        # only when the index has to change
+        if set_index is not None and df.index.name != set_index:
+            df = df.set_index(set_index)
 
-        if set_index is not None:
-            df.set_index(set_index, inplace = True)
+        if convert_to_datetimeindex is True and \
+           not isinstance(df.index, DatetimeIndex):
+            df = df.copy(deep = False)
+            df.index = DatetimeIndex(df.index)
 
-        if sort_index is True:
-            df.sort_index(inplace = True)
+        if sort_index is True and not df.index.is_monotonic_increasing:
+            df = df.sort_index()
 
         return function(df, *args, **kwargs)
     return wrapped
@@ -49,10 +54,16 @@ def period(function):
     """
     @wraps(function)
     def wrapped(df, index_column = None, *args, **kwargs):
-        try:
-            df2 = df.loc[kwargs.get("f"): kwargs.get("t")]
-        except KeyError:
-            raise TypeError("Index not a valid datetime object")
+        f, t = kwargs.get("f"), kwargs.get("t")
+        if f is None and t is None:
+            df2 = df
+        else:
+            # positions found by searching the sorted index;
+            # the slice shares the data of df
+            try:
+                df2 = df.iloc[df.index.slice_indexer(f, t)]
+            except KeyError:
+                raise TypeError("Index not a valid datetime object")
         [kwargs.pop(prop, None) for prop in ["f", "t", "index_column"]]
         return function(df2, *args, **kwargs)
     return wrapped
@@ -66,16 +77,17 @@ def frequency(function):
     Notes
     -----
     Uses the ffill method to fill nans
+    Data already at the frequency is used as it is
 
     TO DO: add arguments to decorators
     """
     @wraps(function)
     def wrapped(df, *args, **kwargs):
-        if kwargs.get("freq") is not None:
-            df2 = df.asfreq(kwargs.get("freq"), method = "ffill")
-        else:
+        freq = kwargs.pop("freq", None)
+        if freq is None or getattr(df.index, "freq", None) == to_offset(freq):
             df2 = df
-        kwargs.pop("freq", None)
+        else:
+            df2 = df.asfreq(freq, method = "ffill")
         return function(df2, *args, **kwargs)
     return wrapped
 
@@ -0,0 +1,217 @@
+# Columnar, array backed storage
+
+import datetime
+import numpy as np
+from pandas import Timestamp, DatetimeIndex, Period, factorize
+
+def to_ns(TS = None):
+    """
+    Convert a timestamp to nanoseconds since epoch
+    TS
+        any valid python datetime or string
+        If None, the present time is taken
+    """
+    if TS is None:
+        TS = datetime.datetime.now()
+    return Timestamp(TS).value
+
+def to_ns_array(TS, length = None):
+    """
+    Convert a sequence of timestamps to an int64 array of nanoseconds
+    TS
+        list/array of timestamps or a single timestamp
+    length
+        length of the array when a single timestamp is given
+    """
+    if np.ndim(TS) == 0:
+        return np.repeat(np.int64(to_ns(TS)), length or 1)
+    return np.asarray(DatetimeIndex(TS).asi8, dtype = np.int64)
+
+def ns_bounds(from_period = None, to_period = None):
+    """
+    Convert a period to an inclusive range of nanoseconds
+    from_period
+        start of the period; None for no lower bound
+    to_period
+        end of the period; None for no upper bound
+
+    Strings are treated as partial dates as in pandas indexing,
+    so "2014-03" as the end of the period includes all of March
+    """
+    bounds = np.iinfo(np.int64)
+    lo = bounds.min if from_period is None else to_ns(from_period)
+    if to_period is None:
+        hi = bounds.max
+    elif isinstance(to_period, ("".__class__, u"".__class__)):
+        hi = Period(to_period).end_time.value
+    else:
+        hi = to_ns(to_period)
+    return lo, hi
+
+
+class Interner(object):
+    """
+    Map hashable values (usually symbols) to integer codes
+    Codes are assigned in the order in which values are seen
+    """
+    def __init__(self):
+        self._codes = {}
+        self._values = []
+
+    def __len__(self):
+        return len(self._values)
+
+    def __contains__(self, value):
+        return value in self._codes
+
+    def code(self, value):
+        """
+        Get the code for a value, assigning a new code if required
+        """
+        c = self._codes.get(value)
+        if c is None:
+            c = len(self._values)
+            self._codes[value] = c
+            self._values.append(value)
+        return c
+
+    def codes(self, values):
+        """
+        Get the codes for an array of values
+        Each unique value is looked up only once
+        """
+        inverse, uniques = factorize(np.asarray(values, dtype = object))
+        lookup = np.array([self.code(u) for u in uniques], dtype = np.int64)
+        return lookup[inverse]
+
+    def get(self, value, default = -1):
+        """
+        Get the code for a value without assigning one
+        """
+        return self._codes.get(value, default)
+
+    def values(self, codes = None):
+        """
+        Get the values for the given codes as an object array
+        If codes is None, all values are returned
+        """
+        arr = np.array(self._values, dtype = object)
+        return arr if codes is None else arr[codes]
+
+
+class ColumnStore(object):
+    """
+    Preallocated numpy arrays per field with amortized growth
+    """
+    def __init__(self, fields, capacity = 1024):
+        """
+        fields
+            list of 2-tuples with field name and numpy dtype
+        capacity
+            number of rows to preallocate
+
+        Fields not declared upfront are added as object columns
+        the first time a value is given for them
+        """
+        self._capacity = max(int(capacity), 1)
+        self._fields = []
+        self._data = {}
+        self._n = 0
+        self.version = 0 # incremented on every change; used to invalidate caches
+        for name, dtype in fields:
+            self._add_field(name, dtype)
+
+    def __len__(self):
+        return self._n
+
+    def __getitem__(self, name):
+        """
+        A view of the filled part of a field
+        """
+        return self._data[name][:self._n]
+
+    def __contains__(self, name):
+        return name in self._data
+
+    @property
+    def fields(self):
+        return list(self._fields)
+
+    def _add_field(self, name, dtype = object):
+        self._fields.append(name)
+        self._data[name] = np.empty(self._capacity, dtype = dtype)
+        if self._data[name].dtype == object:
+            self._data[name][:] = None
+
+    def _reserve(self, n):
+        """
+        Make sure there is space for n more rows
+        Capacity is doubled on growth so appends are amortized O(1)
+        """
+        needed = self._n + n
+        if needed <= self._capacity:
+            return
+        capacity = max(needed, 2 * self._capacity)
+        for name in self._fields:
+            old = self._data[name]
+            new = np.empty(capacity, dtype = old.dtype)
+            if new.dtype == object:
+                new[self._n:] = None
+            new[:self._n] = old[:self._n]
+            self._data[name] = new
+        self._capacity = capacity
+
+    def append(self, **values):
+        """
+        Append a single row
+        """
+        self._reserve(1)
+        for name, value in values.items():
+            if name not in self._data:
+                self._add_field(name)
+            self._data[name][self._n] = value
+        self._n += 1
+        self.version += 1
+        return self._n - 1
+
+    def extend(self, **arrays):
+        """
+        Append a batch of rows
+        Each value must be an array of the same length or a scalar
+        """
+        lengths = set(len(v) for v in arrays.values() if np.ndim(v) > 0)
+        if len(lengths) > 1:
+            raise ValueError("All arrays must be of the same length")
+        n = lengths.pop() if lengths else 1
+        self._reserve(n)
+        for name, value in arrays.items():
+            if name not in self._data:
+                self._add_field(name)
+            self._data[name][self._n:self._n + n] = value
+        self._n += n
+        self.version += 1
+        return n
+
+    def add_at(self, index, **values):
+        """
+        Add values in place to existing rows
+        index
+            row number or array of row numbers; repeated rows accumulate
+        """
+        scalar = np.ndim(index) == 0
+        for name, value in values.items():
+            if scalar:
+                self._data[name][index] += value
+            else:
+                np.add.at(self._data[name], index, value)
+        self.version += 1
+
+    def clear(self):
+        """
+        Remove all rows; the allocated capacity is retained
+        """
+        for name in self._fields:
+            if self._data[name].dtype == object:
+                self._data[name][:self._n] = None
+        self._n = 0
+        self.version += 1
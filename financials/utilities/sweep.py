@@ -0,0 +1,135 @@
+"""
+Parameter sweeps of profit over a universe of OHLC data
+
+The prices are written once to a memory mapped file that every worker
+opens on its own, so no dataframes are pickled between processes. Work
+is split by chunks of symbols and each worker writes the profit of
+every bar for every parameter set into a shared memory mapped result
+"""
+
+import os
+import shutil
+import tempfile
+from itertools import product
+from multiprocessing import Pool, cpu_count
+import numpy as np
+from pandas import DataFrame, MultiIndex, factorize
+from financials.utilities.utilities import profit_array
+
+_FIELDS = ["O", "H", "L", "C"]
+_STATS = ["mean", "median", "hit_rate", "count"]
+
+def _run(task):
+    """
+    Evaluate all the parameter sets over a chunk of rows
+    Runs in a worker process
+    """
+    prices, results, start, stop, grid, options, seed = task
+    prices = np.load(prices, mmap_mode = "r")
+    out = np.load(results, mmap_mode = "r+")
+    O, H, L, C = [np.array(prices[i, start:stop]) for i in range(len(_FIELDS))]
+    for k, (BuyAt, SellAt, entry) in enumerate(grid):
+        out[k, start:stop] = profit_array(O, H, L, C, BuyAt = BuyAt, SellAt = SellAt,
+                                          entry = entry,
+                                          seed = None if seed is None else seed + k,
+                                          **options)
+    out.flush()
+    return stop - start
+
+def _chunks(codes, n):
+    """
+    Split rows sorted by symbol code into about n chunks of whole symbols
+    returns a list of (start, stop) rows
+    """
+    bounds = np.r_[0, np.flatnonzero(codes[1:] != codes[:-1]) + 1, len(codes)]
+    cut = np.unique(np.searchsorted(bounds, np.linspace(0, len(codes), n + 1)))
+    edges = np.unique(bounds[np.minimum(cut, len(bounds) - 1)])
+    return list(zip(edges[:-1], edges[1:]))
+
+def sweep(data, BuyAt = (0.,), SellAt = (0.,), entry = ("infer",),
+          symbol_column = "Symbol", processes = None, chunks = 32,
+          seed = None, **options):
+    """
+    Evaluate profit for a grid of parameters over OHLC data
+    data
+        dataframe with columns O, H, L, C and a symbol column
+        Each row is a bar evaluated independently
+    BuyAt, SellAt, entry
+        lists of values for the corresponding arguments of profit
+        Every combination of the values is evaluated
+    symbol_column
+        column with the symbol; chunks always hold whole symbols
+    processes
+        number of worker processes; 1 to run in this process
+        By default, the number of cpus
+    chunks
+        number of chunks the symbols are split into
+    seed
+        seed for random entries; each chunk and parameter set gets
+        its own seed derived from it, so results are repeatable for
+        the same seed and number of chunks
+    options
+        other arguments to profit such as percent, OPEN and digits
+
+    returns a dataframe indexed by BuyAt, SellAt and entry with the
+    mean and median profit, the hit rate (share of bars with a
+    positive profit) and the number of bars with a valid profit
+
+    >>> from pandas import DataFrame
+    >>> df = DataFrame({"Symbol": list("AABB"), "O": [100, 100, 50, 50], \
+        "H": [104, 103, 52, 51], "L": [97, 98, 49, 48], "C": [102, 99, 51, 49]})
+    >>> cube = sweep(df, BuyAt = [0, 0.01], processes = 1)
+    >>> cube["mean"].round(4).tolist()
+    [0.0025, -0.0074]
+    >>> cube["hit_rate"].tolist()
+    [0.5, 0.5]
+    """
+    grid = list(product(BuyAt, SellAt, entry))
+    codes = factorize(data[symbol_column].values, sort = True)[0]
+    order = np.argsort(codes, kind = "mergesort")
+    processes = processes or cpu_count()
+    chunks = _chunks(codes[order], chunks)
+
+    folder = tempfile.mkdtemp()
+    try:
+        prices = os.path.join(folder, "prices.npy")
+        results = os.path.join(folder, "results.npy")
+        mm = np.lib.format.open_memmap(prices, mode = "w+", dtype = np.float64,
+                                       shape = (len(_FIELDS), len(data)))
+        for i, c in enumerate(_FIELDS):
+            mm[i] = np.asarray(data[c], dtype = np.float64)[order]
+        mm.flush()
+        del mm
+        out = np.lib.format.open_memmap(results, mode = "w+", dtype = np.float64,
+                                        shape = (len(grid), len(data)))
+        del out
+        tasks = [(prices, results, start, stop, grid, options,
+                  None if seed is None else seed + i * len(grid))
+                 for (i, (start, stop)) in enumerate(chunks)]
+        if processes == 1:
+            for task in tasks:
+                _run(task)
+        else:
+            pool = Pool(processes)
+            try:
+                pool.map(_run, tasks)
+            finally:
+                pool.close()
+                pool.join()
+
+        out = np.load(results, mmap_mode = "r")
+        stats = np.empty((len(grid), len(_STATS)))
+        for k in range(len(grid)):
+            values = np.array(out[k])
+            values = values[~np.isnan(values)]
+            if len(values):
+                stats[k] = [values.mean(), np.median(values), (values > 0).mean(),
+                            len(values)]
+            else:
+                stats[k] = [np.nan, np.nan, np.nan, 0]
+        del out
+    finally:
+        shutil.rmtree(folder, ignore_errors = True)
+
+    index = MultiIndex.from_tuples(grid, names = ["BuyAt", "SellAt", "entry"])
+    return DataFrame(stats, index = index, columns = _STATS)
@@ -0,0 +1,28 @@
+import numpy as np
+from pandas import DataFrame, date_range
+from financials.utilities.decorators import dataframe
+
+dates = date_range("2014-01-01", periods = 60, freq = "B")
+df = DataFrame({"C": np.arange(60.0)}, index = dates)
+
+def test_period():
+    sliced = dataframe(df, f = "2014-01-06", t = "2014-02")
+    assert sliced.equals(df.loc["2014-01-06":"2014-02"])
+    assert np.may_share_memory(sliced.values, df.values)
+    assert dataframe(df) is df
+
+def test_clean_up():
+    flat = df.reset_index()
+    before = flat.copy()
+    result = dataframe(flat.iloc[::-1], set_index = "index", sort_index = True)
+    assert result.equals(df.rename_axis("index"))
+    assert flat.equals(before)
+
+def test_frequency():
+    from financials.tools.indicators import BB
+    daily = df.asfreq("D", method = "ffill")
+    assert dataframe(daily, freq = "D") is daily
+    assert dataframe(df, freq = "D").equals(daily)
+    bands = BB(df, n = 5, freq = "D")
+    assert bands.index.equals(daily.index)
+    assert bands.equals(BB(daily, n = 5))
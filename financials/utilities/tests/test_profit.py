@@ -260,4 +260,42 @@ def test_profit():
     TO DO: Corner case for BuyAt = 1
     TO DO: Checks to see OHLC is valid
     """
-    pass
\ No newline at end of file
+    pass
+
+
+def test_profit_array():
+    """
+    profit_array agrees with profit on the examples and on random bars
+    """
+    import doctest
+    import numpy as np
+    from financials.utilities.utilities import profit_array
+    one = lambda *args, **kwargs: profit_array(*[[x] for x in args], **kwargs)[0]
+    for example in doctest.DocTestParser().get_examples(test_profit.__doc__ + profit.__doc__):
+        if example.source.startswith("profit(") and not example.options:
+            assert eval(example.source, {"profit": profit}) == \
+                   eval(example.source, {"profit": one}), example.source
+
+    np.random.seed(10)
+    n = 2000
+    O = np.random.randint(95, 105, n)
+    H = O + np.random.randint(0, 5, n)
+    L = O - np.random.randint(0, 5, n)
+    C = L + (np.random.rand(n) * (H - L + 1)).astype(int)
+    BuyAt = np.random.choice([0, 0.01, -0.02, 98, 100, 103], n)
+    SellAt = np.random.choice([0, 0.02, -0.01, 97, 100, 104], n)
+    entry = np.random.choice(["infer", "B", "S"], n)
+    OPEN = np.random.rand(n) > 0.5
+    for percent in ("infer", True, False):
+        result = profit_array(O, H, L, C, BuyAt, SellAt, percent = percent,
+                              entry = entry, OPEN = OPEN)
+        expected = [profit(o, h, l, c, BuyAt = b, SellAt = s, percent = percent,
+                           entry = e, OPEN = op) for (o, h, l, c, b, s, e, op) in
+                    zip(O, H, L, C, BuyAt, SellAt, entry, OPEN)]
+        assert np.allclose(result, expected, equal_nan = True)
+
+    # random entries are reproducible with a seed
+    a = profit_array(O, H, L, C, 98, 104, entry = "R", seed = 1)
+    b = profit_array(O, H, L, C, 98, 104, entry = 0.5, seed = 1)
+    assert np.array_equal(a, profit_array(O, H, L, C, 98, 104, entry = "R", seed = 1))
+    assert np.array_equal(b, profit_array(O, H, L, C, 98, 104, entry = 0.5, seed = 1))
@@ -1,5 +1,8 @@
 # General utilities
 
+import random
+import numpy as np
+
 def charges(basic = 1, *args, **kwargs):
     """
     Calculate charges based on the given structure
@@ -12,6 +15,10 @@ def charges(basic = 1, *args, **kwargs):
     percent: Boolean/default True
         If False, numbers aren't converted to percentages
 
+    basic could also be an array of values; charges are then calculated
+    for each value. Use FeeSchedule to reuse a cost structure and to get
+    the charges by component
+
 
     Format
     ======
@@ -45,22 +52,87 @@ def charges(basic = 1, *args, **kwargs):
     136.5
     """
 
-    p = 0.01
-    result = {}
-    result['basic'] = basic
-    for (a,b,c) in args:
+    return FeeSchedule(*args, **kwargs)(basic)
 
-        if b == 'acc':
-            if result.get(a.lower()):
-                result[a.lower()] = result[a.lower()] + sum(result.values()) * c * p
-            else:
-                result[a.lower()] = sum(result.values()) * c * p
-        else:
-            if result.get(a.lower()):
-                result[a.lower()] = result[a.lower()] + result[b.lower()] * c * p
+
+class FeeSchedule(object):
+    """
+    A cost structure compiled into a plan that could be applied
+    to arrays of values at once
+    The format of the cost structure is the same as charges
+
+    >>> fees = FeeSchedule(['tax', 'basic', 10], ['commission', 'basic', 20], ['tax', 'acc', 5])
+    >>> fees(100)
+    136.5
+    >>> fees([100, 200]).tolist()
+    [136.5, 273.0]
+    >>> df = fees.breakdown([100, 200])
+    >>> list(df.columns)
+    ['basic', 'tax', 'commission']
+    >>> df.tax.tolist()
+    [16.5, 33.0]
+
+    A source must be basic, acc or a component defined before it
+    >>> FeeSchedule(['tax', 'nope', 10])
+    Traceback (most recent call last):
+    ...
+    KeyError: 'nope'
+    """
+    def __init__(self, *args, **kwargs):
+        """
+        args
+            cost structure as in charges
+        kwargs
+            percent as in charges
+        """
+        p = 0.01 if kwargs.get("percent", True) else 1
+        self.components = ["basic"]
+        # each step adds factor times the source to the target
+        # source is None for the accumulated value of all components
+        self._plan = []
+        for (a, b, c) in args:
+            a = a.lower()
+            if b == 'acc':
+                source = None
+            elif b.lower() in self.components:
+                source = self.components.index(b.lower())
             else:
-                result[a.lower()] = result[b.lower()] * c * p
-    return sum(result.values())
+                raise KeyError(b.lower())
+            self._plan.append((self._index(a), source, c * p))
+
+    def _index(self, name):
+        if name not in self.components:
+            self.components.append(name)
+        return self.components.index(name)
+
+    def _evaluate(self, basic):
+        """
+        Value of each component as a 2d array
+        """
+        basic = np.asarray(basic, dtype = np.float64)
+        values = np.zeros((len(self.components),) + basic.shape)
+        values[0] = basic
+        total = basic.copy()
+        for (target, source, factor) in self._plan:
+            amount = (total if source is None else values[source]) * factor
+            values[target] += amount
+            total += amount
+        return values, total
+
+    def __call__(self, basic):
+        """
+        Total of all components for a value or an array of values
+        """
+        total = self._evaluate(basic)[1]
+        return float(total) if np.ndim(total) == 0 else total
+
+    def breakdown(self, basic):
+        """
+        Value of each component as a dataframe
+        """
+        from pandas import DataFrame
+        values = self._evaluate(np.atleast_1d(basic))[0]
+        return DataFrame(values.T, columns = self.components)
 
 
 def profit(O,H,L,C, BuyAt = 0., SellAt = 0., percent = "infer",
@@ -108,7 +180,6 @@ def profit(O,H,L,C, BuyAt = 0., SellAt = 0., percent = "infer",
     >>> profit(100, 103, 98, 102, BuyAt = -0.01)
     0.0303
     """
-    import random
     E = entry
     if E == "infer":
         if BuyAt != 0:
@@ -157,6 +228,195 @@ def profit(O,H,L,C, BuyAt = 0., SellAt = 0., percent = "infer",
     # print BUY,SELL,P,E
     return round(P/BUY, digits) if E == "B" else round(P/SELL, digits)
 
+def profit_array(O, H, L, C, BuyAt = 0., SellAt = 0., percent = "infer",
+                 entry = "infer", OPEN = False, digits = 4, seed = None):
+    """
+    Calculate the profit of trades over arrays of OHLC prices
+    This is the array version of profit and follows the same rules
+
+    O, H, L, C
+        arrays of Open, High, Low and Close prices
+    BuyAt, SellAt
+        a number or an array of numbers as in profit
+    entry
+        a single entry or an array of entries as in profit
+        "infer", "B", "S", "R" or a number between 0 and 1
+    seed
+        seed for the random entries
+    returns an array of profits
+
+    >>> profit_array([100, 100, 100], [104, 104, 108], [97, 97, 100], [102, 102, 105], \
+        BuyAt = [0, 0.01, 100], OPEN = [False, False, True]).tolist()
+    [0.02, 0.0099, 0.0]
+    >>> profit_array([100, 100], [104, 104], [97, 97], [102, 102], \
+        BuyAt = 99, SellAt = 101, entry = ["B", "S"]).tolist()
+    [0.0202, 0.0198]
+    """
+    O, H, L, C = [np.asarray(x, dtype = np.float64) for x in (O, H, L, C)]
+    n = len(O)
+    BuyAt = np.asarray(BuyAt, dtype = np.float64) + np.zeros(n)
+    SellAt = np.asarray(SellAt, dtype = np.float64) + np.zeros(n)
+    OPEN = np.asarray(OPEN, dtype = bool) + np.zeros(n, dtype = bool)
+    rng = np.random.RandomState(seed)
+
+    E = np.asarray(entry)
+    if E.dtype.kind in "biuf":
+        is_buy = rng.random_sample(n) > E
+    else:
+        E = np.resize(E.astype(object), n)
+        infer = E == "infer"
+        is_buy = (E == "B") | (infer & ((BuyAt != 0) | (SellAt == 0)))
+        choice = E == "R"
+        is_buy[choice] = rng.random_sample(choice.sum()) < 0.5
+
+    as_price = lambda x: x if percent is False else np.where(x > 1, x, O * (1 + x))
+    BUY = np.where(~is_buy & (BuyAt == 0), C, as_price(BuyAt))
+    SELL = np.where(is_buy & (SellAt == 0), C, as_price(SellAt))
+
+    inrange = lambda x: (x <= H) & (x >= L) & ~(((x == H) | (x == L)) & OPEN)
+    buy_in, sell_in = inrange(BUY), inrange(SELL)
+    P = np.where(buy_in & sell_in, SELL - BUY,
+        np.where(buy_in, C - BUY, np.where(sell_in, SELL - C, 0.0)))
+    is_buy = np.where(buy_in & ~sell_in, True, np.where(~buy_in & sell_in, False, is_buy))
+    with np.errstate(divide = "ignore", invalid = "ignore"):
+        result = P / np.where(is_buy, BUY, SELL)
+    # round halves away from zero like round in profit
+    scale = 10.0 ** digits
+    return np.copysign(np.floor(np.abs(result) * scale + 0.5) / scale, result)
+
+def _changes(frame):
+    """
+    Dates and symbols of a dataframe of index changes
+    Every value in a row is a symbol
+    """
+    if frame is None or len(frame) == 0:
+        return np.zeros(0, dtype = np.int64), np.zeros(0, dtype = object)
+    values = np.asarray(frame.values, dtype = object)
+    width = values.shape[1] if values.ndim > 1 else 1
+    dates = frame.index.normalize().asi8
+    return np.repeat(dates, width), values.ravel()
+
+
+class IndexMembership(object):
+    """
+    Constituents of an index stored as a log of changes
+
+    Each symbol is kept as a list of [start, end) intervals during which
+    it is a member, so the constituents on any date are found without
+    going through the days in between
+
+    >>> from pandas import DataFrame, DatetimeIndex
+    >>> IM = IndexMembership("2014-01-01", "2014-01-03", ["A", "B"], \
+        include = DataFrame(["C"], index = DatetimeIndex(["2014-01-02"])),\
+        exclude = DataFrame(["A"], index = DatetimeIndex(["2014-01-02"])))
+    >>> IM.members_at("2014-01-01").tolist(), IM.members_at("2014-01-02").tolist()
+    (['A', 'B'], ['B', 'C'])
+    >>> IM.membership_matrix(["2014-01-01", "2014-01-03"]).values.tolist()
+    [[True, True, False], [False, True, True]]
+    """
+    def __init__(self, from_date, to_date, constituents, include = None,
+                 exclude = None):
+        """
+        from_date
+            Start date of the index
+        to_date
+            End date of the index
+        constituents
+            Constituents of the index to begin with
+        include
+            constituents to be included as a dataframe with datetime index
+        exclude
+            constituents to be removed as a dataframe with datetime index
+        """
+        from pandas import Timestamp
+        from financials.utilities.store import Interner
+        self._start = Timestamp(from_date).normalize().value
+        # the index covers to_date fully
+        self._stop = Timestamp(to_date).normalize().value + np.int64(86400 * 10**9)
+        constituents = np.asarray(list(constituents), dtype = object)
+        added = _changes(include)
+        removed = _changes(exclude)
+        # additions on a date are applied before removals, as in build_index
+        TS = np.r_[np.full(len(constituents), self._start, dtype = np.int64),
+                   added[0], removed[0]]
+        S = np.r_[constituents, added[1], removed[1]]
+        action = np.r_[np.ones(len(constituents) + len(added[1]), dtype = np.int8),
+                       -np.ones(len(removed[1]), dtype = np.int8)]
+        keep = (TS >= self._start) & (TS < self._stop)
+        TS, S, action = TS[keep], S[keep], action[keep]
+
+        symbols = Interner()
+        codes = symbols.codes(S) if len(S) else np.zeros(0, dtype = np.int64)
+        order = np.lexsort((-action, TS, codes))
+        self._log = (TS[order], codes[order], action[order])
+        self._symbols = symbols
+        self._intervals()
+
+    def _intervals(self):
+        """
+        Turn the log into membership intervals for each symbol
+        """
+        TS, codes, action = self._log
+        member = action > 0
+        first = np.r_[True, codes[1:] != codes[:-1]] if len(codes) else np.zeros(0, dtype = bool)
+        before = np.r_[False, member[:-1]] & ~first
+        change = member != before
+        TS, codes, member = TS[change], codes[change], member[change]
+        # changes of a symbol alternate between joining and leaving
+        starts = np.flatnonzero(member)
+        ends = starts + 1
+        closed = ends < len(codes)
+        closed[closed] = codes[ends[closed]] == codes[starts[closed]]
+        # codes are renumbered in the sorted order of symbols
+        names = self._symbols.values()
+        rank = np.empty(len(names), dtype = np.int64)
+        rank[np.argsort(names, kind = "mergesort")] = np.arange(len(names))
+        self.names = np.sort(names)
+        self.codes = rank[codes[starts]]
+        self.start = TS[starts]
+        self.end = np.where(closed, TS[np.minimum(ends, len(TS) - 1)], self._stop)
+
+    @property
+    def changes(self):
+        """
+        The log of changes as a dataframe
+        A is 1 for additions and -1 for removals
+        """
+        from pandas import DataFrame
+        TS, codes, action = self._log
+        df = DataFrame({"TS": TS.view("datetime64[ns]"),
+                        "S": self._symbols.values(codes), "A": action},
+                       columns = ["TS", "S", "A"])
+        return df.sort_values("TS", kind = "mergesort").reset_index(drop = True)
+
+    def members_at(self, date):
+        """
+        Constituents of the index on the given date as a sorted array
+        """
+        from financials.utilities.store import to_ns
+        TS = to_ns(date)
+        live = (self.start <= TS) & (TS < self.end)
+        return self.names[np.sort(self.codes[live])]
+
+    def membership_matrix(self, dates):
+        """
+        Membership of each symbol on each of the given dates
+        returns a boolean dataframe with dates as index and symbols
+        as columns
+        """
+        from pandas import DataFrame, DatetimeIndex
+        dates = DatetimeIndex(dates)
+        TS = dates.asi8
+        order = np.argsort(TS, kind = "mergesort")
+        size = len(self.names)
+        counts = np.zeros((len(TS) + 1, size), dtype = np.int32)
+        np.add.at(counts, (np.searchsorted(TS[order], self.start, "left"), self.codes), 1)
+        np.add.at(counts, (np.searchsorted(TS[order], self.end, "left"), self.codes), -1)
+        matrix = np.empty((len(TS), size), dtype = bool)
+        matrix[order] = counts.cumsum(axis = 0)[:-1] > 0
+        return DataFrame(matrix, index = dates, columns = self.names)
+
+
 def build_index(from_date, to_date, constituents, include, exclude):
     """
     Build an index from the list of constituents
@@ -171,30 +431,22 @@ def build_index(from_date, to_date, constituents, include, exclude):
         constituents to be included as a dataframe with datetime index
     exclude
         constituents to be removed as a dataframe with datetime index
+
+    returns a series of constituents indexed by date, sorted within
+    each date. Use IndexMembership for point in time queries
     >>> from pandas import DataFrame, DatetimeIndex, Series
     >>> from datetime import datetime
     >>> BI = build_index("2014-01-01", "2014-01-03", ["A", "B"], \
         include = DataFrame(["C"], index = DatetimeIndex(["2014-01-02"])),\
         exclude = DataFrame(["A"], index = DatetimeIndex(["2014-01-02"])))
-    >>> all(BI == Series(data = ['A', 'B', 'C', 'B', 'C', 'B'], \
+    >>> all(BI == Series(data = ['A', 'B', 'B', 'C', 'B', 'C'], \
         index = [datetime(2014,1,1), datetime(2014,1,1), datetime(2014,1,2), \
         datetime(2014,1,2), datetime(2014,1,3), datetime(2014,1,3)]))
     True
     """
-    from itertools import repeat, chain
-    from numpy import array
     from pandas import date_range, Series
-    index = {}
     dates = date_range(from_date, to_date)
-    constituents = set(constituents)
-    for d in dates:
-        if d in include.index:
-            for i in include.ix[d].values.ravel():
-                constituents.add(i)
-        if d in exclude.index:
-            for i in exclude.ix[d].values.ravel():
-                constituents.remove(i)
-        index[d] = list(constituents)
-    a = [zip(repeat(k, len(v)), v) for k,v in index.iteritems()]
-    b = array(list(chain(*a)))
-    return Series(data = b[:,1], index = b[:, 0]).sort_index()
\ No newline at end of file
+    matrix = IndexMembership(from_date, to_date, constituents, include,
+                             exclude).membership_matrix(dates)
+    rows, columns = np.nonzero(matrix.values)
+    return Series(data = matrix.columns.values[columns], index = dates[rows])